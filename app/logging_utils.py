@@ -0,0 +1,59 @@
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Неблокирующее логирование: корневой логгер пишет записи в очередь, а форматирование
+# и запись в файл/консоль выполняет отдельный поток QueueListener. Так запись логов
+# не задерживает event loop.
+_listener = None
+
+def start_queue_logging():
+    """Перенести текущие обработчики корневого логгера за QueueHandler/QueueListener"""
+    global _listener
+    if _listener is not None:
+        return
+
+    root = logging.getLogger()
+    handlers = [handler for handler in root.handlers if not isinstance(handler, QueueHandler)]
+    if not handlers:
+        return
+
+    log_queue = queue.Queue(-1)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def stop_queue_logging():
+    """Дописать оставшиеся записи и вернуть обработчики корневому логгеру"""
+    global _listener
+    if _listener is None:
+        return
+
+    listener, _listener = _listener, None
+    listener.stop()
+    _restore_handlers(listener.handlers)
+
+def _restore_handlers(handlers):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+
+def _after_fork_in_child():
+    """В дочернем процессе (fork) потока QueueListener нет - пишем напрямую, как раньше"""
+    global _listener
+    if _listener is None:
+        return
+
+    handlers = _listener.handlers
+    _listener = None
+    _restore_handlers(handlers)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
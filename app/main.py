@@ -1,9 +1,10 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Header, Depends
 from fastapi.responses import JSONResponse
 from app.models import ScanRequest, PATTokenRequest, RulesContent, MultiScanRequest, MultiScanResponseItem
-from app.queue_worker import task_queue, start_worker, add_to_queue_background, add_multi_scan_to_queue, cleanup_executors
+from app.queue_worker import task_queue, start_worker, add_to_queue_background, add_multi_scan_to_queue, add_local_scan_to_queue, cleanup_executors, init_workdir_pool, warm_up_scan_pool, download_executor
 from app.model_loader import get_model_instance
 from app.repo_utils import check_ref_and_resolve_git, check_ref_and_resolve_azure
+from app.logging_utils import start_queue_logging
 import asyncio
 import os
 import yaml
@@ -41,6 +42,9 @@ async def lifespan(app: FastAPI):
     # Startup
     global worker_tasks
     
+    # Запись логов - в отдельном потоке, не блокируя event loop
+    start_queue_logging()
+    
     logger.info(f"Запуск сервиса с {MAX_WORKERS} воркерами...")
     
     # Pre-load model in main process
@@ -50,6 +54,16 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Ошибка загрузки модели: {e}")
     
+    # Загрузки repo_utils выполняются через run_in_executor(None, ...) - направляем их в download_executor
+    asyncio.get_running_loop().set_default_executor(download_executor)
+    init_workdir_pool()
+    
+    # Процессы сканирования создаются после загрузки модели (при fork они получают её без повторной загрузки)
+    try:
+        await warm_up_scan_pool()
+    except Exception as e:
+        logger.error(f"Ошибка запуска процессов сканирования: {e}")
+    
     # Start concurrent workers
     for i in range(MAX_WORKERS):
         task = asyncio.create_task(start_worker())
@@ -142,6 +156,7 @@ async def health():
     return {
         "status": "healthy", 
         "queue_size": task_queue.qsize(),
+        "queue_max": task_queue.maxsize,
         "max_workers": MAX_WORKERS,
         "active_workers": len(worker_tasks),
         "supports_multi_scan": True
@@ -153,7 +168,7 @@ async def multi_scan(request: MultiScanRequest):
     """Process multiple repositories sequentially"""
     
     # Check queue capacity
-    if task_queue.qsize() >= MAX_WORKERS * 2:
+    if task_queue.full():
         return JSONResponse(status_code=429, content={
             "status": "queue_full",
             "message": f"Очередь переполнена ({task_queue.qsize()} задач). Попробуйте позже.",
@@ -211,17 +226,18 @@ async def multi_scan(request: MultiScanRequest):
         commits = []
         
         for repo, response_item in zip(request.repositories, response_data):
-            multi_scan_items.append({
-                "ProjectName": repo.ProjectName,
-                "RepoUrl": repo.RepoUrl,
-                "RefType": repo.RefType,
-                "Ref": repo.Ref,
-                "CallbackUrl": repo.CallbackUrl
-            })
+            multi_scan_items.append(repo.model_dump())
             commits.append(response_item.commit)
         
         # Add to queue for sequential processing
-        await add_multi_scan_to_queue(multi_scan_items, commits)
+        try:
+            await add_multi_scan_to_queue(multi_scan_items, commits, request.batch_callback)
+        except asyncio.QueueFull:
+            return JSONResponse(status_code=429, content={
+                "status": "queue_full",
+                "message": f"Очередь переполнена ({task_queue.qsize()} задач). Попробуйте позже.",
+                "data": [item.dict() for item in response_data]
+            })
         
         return JSONResponse(
             content={
@@ -246,8 +262,8 @@ async def multi_scan(request: MultiScanRequest):
 
 @app.post("/scan", dependencies=[Depends(validate_api_key)])
 async def scan(request: ScanRequest):
-    # Check queue capacity (allow some buffer over max workers)
-    if task_queue.qsize() >= MAX_WORKERS * 2:
+    # Check queue capacity
+    if task_queue.full():
         return JSONResponse(status_code=429, content={
             "status": "queue_full",
             "RefType": request.RefType,
@@ -276,7 +292,15 @@ async def scan(request: ScanRequest):
         logger.info(f"Commit resolved {commit[0:6]}.. для {request.ProjectName}")
 
         # Add to queue for processing
-        await add_to_queue_background(request, commit)
+        try:
+            await add_to_queue_background(request, commit)
+        except asyncio.QueueFull:
+            return JSONResponse(status_code=429, content={
+                "status": "queue_full",
+                "RefType": request.RefType,
+                "Ref": request.Ref,
+                "message": f"Очередь переполнена ({task_queue.qsize()} задач). Попробуйте позже."
+            })
         
         response = JSONResponse(
             content={
@@ -328,7 +352,7 @@ async def local_scan(
         # print(f"  - zip_file.content_type: {zip_file.content_type}")
         
         # Check queue capacity
-        if task_queue.qsize() >= MAX_WORKERS * 2:
+        if task_queue.full():
             return JSONResponse(status_code=429, content={
                 "status": "queue_full",
                 "message": f"Очередь переполнена ({task_queue.qsize()} задач). Попробуйте позже."
@@ -357,8 +381,13 @@ async def local_scan(
         }
 
         # Add to queue with file content instead of file object
-        await task_queue.put(("local_scan", request_dict, zip_content))
-        logger.info(f"Локальное сканирование {ProjectName} поставлено в очередь")
+        try:
+            await add_local_scan_to_queue(request_dict, zip_content)
+        except asyncio.QueueFull:
+            return JSONResponse(status_code=429, content={
+                "status": "queue_full",
+                "message": f"Очередь переполнена ({task_queue.qsize()} задач). Попробуйте позже."
+            })
         
         return JSONResponse(
             content={
@@ -371,9 +400,7 @@ async def local_scan(
         )
     
     except Exception as e:
-        logger.error(f"Ошибка при добавлении локального сканирования: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Ошибка при добавлении локального сканирования: {e}")
         return JSONResponse(status_code=500, content={
             "status": "error",
             "message": f"Внутренняя ошибка сервера: {str(e)}"
@@ -1,6 +1,7 @@
 import os
 import time
 import joblib
+import numpy as np
 import random
 import csv
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -28,6 +29,28 @@ def setup_logging(console_mode=False):
 # Default logger for import mode
 logger = setup_logging(console_mode=False)
 
+# Сжатие при сохранении модели: lz4 распаковывается быстрее, чем читается несжатый coef_ с диска,
+# поэтому ускоряет холодный старт. Без пакета lz4 сохраняем без сжатия (joblib.load определяет формат сам)
+try:
+    import lz4
+    MODEL_COMPRESSION = ('lz4', 3)
+except ImportError:
+    MODEL_COMPRESSION = 0
+
+def logits_to_pred_proba(logits):
+    """
+    Пост-обработка decision_function бинарной модели за один проход:
+    возвращает (предсказания, вероятность класса 1). Сигмоида считается in-place
+    в одном буфере, без отдельных временных массивов predict/predict_proba.
+    """
+    preds = logits > 0
+    proba = np.negative(logits, dtype=np.float64)
+    with np.errstate(over='ignore'):
+        np.exp(proba, out=proba)
+    proba += 1.0
+    np.reciprocal(proba, out=proba)
+    return preds, proba
+
 class SecretClassifier:
     _instance = None
     model = None
@@ -93,8 +116,8 @@ class SecretClassifier:
         # Ensure directories exist
         os.makedirs(os.path.dirname(self.MODEL_PATH), exist_ok=True)
         
-        joblib.dump(self.model, self.MODEL_PATH)
-        joblib.dump(self.vectorizer, self.VECTORIZER_PATH)
+        joblib.dump(self.model, self.MODEL_PATH, compress=MODEL_COMPRESSION)
+        joblib.dump(self.vectorizer, self.VECTORIZER_PATH, compress=MODEL_COMPRESSION)
 
     def retrain_model(self):
         """Переобучение модели с нуля"""
@@ -196,8 +219,8 @@ class SecretClassifier:
             # Векторизованное предсказание (быстро!)
             print("🔄 Обработка данных...")
             X_vec = self.vectorizer.transform(X)
-            y_pred = self.model.predict(X_vec)
-            y_proba = self.model.predict_proba(X_vec)
+            y_pred, y_proba = logits_to_pred_proba(self.model.decision_function(X_vec))
+            y_pred = y_pred.astype(int)
             
             processing_time = time.time() - start_time
             
@@ -220,7 +243,7 @@ class SecretClassifier:
             wrong_predictions = []
             for i, (text, true_label, pred_label, proba) in enumerate(zip(X, y, y_pred, y_proba)):
                 if true_label != pred_label:
-                    confidence = proba[1]  # Вероятность класса "Secret"
+                    confidence = float(proba)  # Вероятность класса "Secret"
                     wrong_predictions.append({
                         'secret': text,
                         'expected': y_str[i],
@@ -366,16 +389,16 @@ class SecretClassifier:
         try:
             # Предсказание для основного текста
             X_vec = self.vectorizer.transform([text])
-            pred_text = self.model.predict(X_vec)[0]
-            proba_text = self.model.predict_proba(X_vec)[0]
-            confidence_text = proba_text[1]
+            preds, probs = logits_to_pred_proba(self.model.decision_function(X_vec))
+            pred_text = int(preds[0])
+            confidence_text = float(probs[0])
             
             # Если есть контекст, делаем предсказание и для него
             if context and context.strip():
                 X_context_vec = self.vectorizer.transform([context])
-                pred_context = self.model.predict(X_context_vec)[0]
-                proba_context = self.model.predict_proba(X_context_vec)[0]
-                confidence_context = proba_context[1]
+                preds, probs = logits_to_pred_proba(self.model.decision_function(X_context_vec))
+                pred_context = int(preds[0])
+                confidence_context = float(probs[0])
                 
                 # Усредняем confidence
                 secret_weight = 1.0
@@ -447,18 +470,36 @@ class SecretClassifier:
         if not secrets:
             return secrets
             
-        # Извлекаем строки для предсказания
-        secret_texts = [item.get("secret", "") for item in secrets]
-        context_texts = [item.get("context", "") for item in secrets]
-        
-        if not secret_texts:
+        # Служебные записи сканера (слишком длинная строка, слишком много секретов) приходят
+        # с уже выставленным severity - модель для них не нужна, векторизуем только остальные
+        needs_pred_idx = []
+        for i, item in enumerate(secrets):
+            if not item.get("severity"):
+                needs_pred_idx.append(i)
+            else:
+                item["secret_confidence"] = None
+                item["secret_prediction"] = None
+                item["context_confidence"] = None
+                item["context_prediction"] = None
+                item["confidence_averaged"] = False
+                if "СТРОКА НЕ СКАНИРОВАЛАСЬ т.к. её длина" in item["secret"] or "ФАЙЛ НЕ ВЫВЕДЕН ПОЛНОСТЬЮ т.к." in item["secret"]:
+                    item["confidence"] = 0.50
+                    item["severity"] = "Potential"
+
+        if not needs_pred_idx:
             return secrets
 
+        # Извлекаем строки для предсказания
+        secret_texts = [None] * len(needs_pred_idx)
+        context_texts = [None] * len(needs_pred_idx)
+        for j, i in enumerate(needs_pred_idx):
+            secret_texts[j] = secrets[i].get("secret", "")
+            context_texts[j] = secrets[i].get("context", "")
+
         try:
             # Предсказания для секретов
             X_secret_vec = self.vectorizer.transform(secret_texts)
-            preds_secret = self.model.predict(X_secret_vec)
-            probs_secret = self.model.predict_proba(X_secret_vec)
+            preds_secret, probs_secret = logits_to_pred_proba(self.model.decision_function(X_secret_vec))
             
             # Предсказания для контекстов (если они есть)
             context_predictions = []
@@ -473,8 +514,7 @@ class SecretClassifier:
                 
                 if contexts_to_predict:
                     X_context_vec = self.vectorizer.transform(contexts_to_predict)
-                    context_preds = self.model.predict(X_context_vec)
-                    context_probs = self.model.predict_proba(X_context_vec)
+                    context_preds, context_probs = logits_to_pred_proba(self.model.decision_function(X_context_vec))
                     
                     # Создаем полный список предсказаний с None для пустых контекстов
                     context_idx = 0
@@ -487,25 +527,26 @@ class SecretClassifier:
                             context_predictions.append(None)
                             context_probabilities.append(None)
                 else:
-                    context_predictions = [None] * len(secrets)
-                    context_probabilities = [None] * len(secrets)
+                    context_predictions = [None] * len(needs_pred_idx)
+                    context_probabilities = [None] * len(needs_pred_idx)
             else:
-                context_predictions = [None] * len(secrets)
-                context_probabilities = [None] * len(secrets)
+                context_predictions = [None] * len(needs_pred_idx)
+                context_probabilities = [None] * len(needs_pred_idx)
 
-            for i, (item, pred_secret, proba_secret) in enumerate(zip(secrets, preds_secret, probs_secret)):
-                confidence_secret = proba_secret[1]  # вероятность класса 1 (что это секрет)
+            for j, (pred_secret, proba_secret) in enumerate(zip(preds_secret, probs_secret)):
+                item = secrets[needs_pred_idx[j]]
+                confidence_secret = float(proba_secret)  # вероятность класса 1 (что это секрет)
                 
                 # Получаем предсказание для контекста если оно есть
-                pred_context = context_predictions[i] if i < len(context_predictions) else None
-                proba_context = context_probabilities[i] if i < len(context_probabilities) else None
+                pred_context = context_predictions[j]
+                proba_context = context_probabilities[j]
                 
                 # Сохраняем детали предсказаний
                 item["secret_confidence"] = round(confidence_secret, 3)
                 item["secret_prediction"] = bool(pred_secret)
                 
                 if pred_context is not None and proba_context is not None:
-                    confidence_context = proba_context[1]
+                    confidence_context = float(proba_context)
                     item["context_confidence"] = round(confidence_context, 3)
                     item["context_prediction"] = bool(pred_context)
                     
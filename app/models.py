@@ -23,6 +23,7 @@ class MultiScanItem(BaseModel):
 
 class MultiScanRequest(BaseModel):
     repositories: List[MultiScanItem]
+    batch_callback: bool = False  # Результаты с одинаковым CallbackUrl - одним запросом в конце
 
 class MultiScanResponseItem(BaseModel):
     ProjectName: str
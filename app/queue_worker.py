@@ -1,20 +1,31 @@
 import asyncio
+import atexit
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from app.models import ScanRequest
-from app.repo_utils import download_repo, delete_dir
+from app.repo_utils import download_repo, delete_dir, safe_extract, extract_executor
+from app import scan_worker
+from app.logging_utils import stop_queue_logging
 import aiohttp
 import os
 import tempfile
+import shutil
 import multiprocessing
-from typing import Tuple
 from dotenv import load_dotenv
 import zipfile
+import io
+import hashlib
+from collections import OrderedDict
+from enum import IntEnum
 import time
-import gzip
+import random
+import zlib
 import base64
 import logging
 import json
-import traceback
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from logging.handlers import RotatingFileHandler
 
 # Setup logging to file
@@ -30,62 +41,343 @@ logger = logging.getLogger("queue_worker")
 
 # Load environment variables
 load_dotenv()
-task_queue = asyncio.Queue()
+# Ограниченная очередь: при переполнении новые запросы получают 429 (обратное давление на приём запросов)
+QUEUE_MAX = int(os.getenv("QUEUE_MAX", "32"))
+task_queue = asyncio.Queue(maxsize=QUEUE_MAX)
 
 HubType = os.getenv("HubType")
 
-# Thread pool for I/O operations (downloads)
-download_executor = ThreadPoolExecutor(max_workers=5)
+# Папка для временных директорий сканирования - создаём один раз при импорте, а не на каждый запрос.
+# Распакованный репозиторий затем целиком обходится сканером, поэтому по умолчанию на Linux
+# используется RAM-диск /dev/shm (на Windows можно указать ImDisk/RAMDisk), иначе - системная временная папка
+_SHM_DIR = "/dev/shm"
+DISK_TEMP_DIR = tempfile.gettempdir()
+TEMP_DIR = os.path.abspath(
+    os.getenv("TEMP_DIR")
+    or (_SHM_DIR if os.path.isdir(_SHM_DIR) and os.access(_SHM_DIR, os.W_OK) else DISK_TEMP_DIR)
+)
+os.makedirs(TEMP_DIR, exist_ok=True)
+# Если в TEMP_DIR (обычно RAM-диск) свободно меньше этого объёма, рабочая директория создаётся на диске
+WORKDIR_MIN_FREE = 512 * 1024 * 1024  # 512 MiB
+
+# Thread pool for I/O operations (downloads). Устанавливается пулом по умолчанию для event loop
+# (см. set_default_executor в lifespan), поэтому в нём же выполняются загрузки из repo_utils
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "16"))
+download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download")
+
+# Все пулы процессов используют один и тот же метод запуска - тот, что настроен в run.py
+# (fork на Linux: дочерние процессы получают уже загруженные модули и модель, spawn на Windows)
+_MP_CONTEXT = multiprocessing.get_context(multiprocessing.get_start_method())
+
+def _physical_cpu_count() -> int:
+    """Число физических ядер (hyperthreading не ускоряет инференс, а каждый процесс держит свою модель).
+    Без psutil - число логических CPU: наличие hyperthreading не угадываем (в контейнерах его обычно нет)"""
+    try:
+        import psutil
+        physical = psutil.cpu_count(logical=False)
+        if physical:
+            return physical
+    except ImportError:
+        pass
+    return os.cpu_count() or 1
+
+# Большие архивы распаковываются в отдельных процессах: на множестве мелких записей
+# распаковка в потоках упирается в GIL. Для небольших архивов запуск процессов дороже выигрыша
+EXTRACT_PROCESS_THRESHOLD = 16 * 1024 * 1024  # 16 MiB
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", "2"))
+extract_process_executor = ProcessPoolExecutor(max_workers=EXTRACT_PROCESSES, mp_context=_MP_CONTEXT) if EXTRACT_PROCESSES > 0 else None
+
+# Process pool for CPU-intensive operations (model inference).
+# Долгоживущие процессы с предзагруженной моделью - каждый держит свою копию (~50 MB),
+# поэтому пул небольшой
+# SCAN_EXECUTOR=thread - сканирование в потоках основного процесса с одной общей моделью:
+# память не растёт с числом воркеров, но regex-сканер частично упирается в GIL
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", str(min(4, _physical_cpu_count()))))
+SCAN_EXECUTOR = os.getenv("SCAN_EXECUTOR", "process").lower()
+if SCAN_EXECUTOR == "thread":
+    model_executor = ThreadPoolExecutor(max_workers=SCAN_WORKERS, thread_name_prefix="scan")
+else:
+    model_executor = ProcessPoolExecutor(max_workers=SCAN_WORKERS, mp_context=_MP_CONTEXT, initializer=scan_worker._worker_init)
+
+async def warm_up_scan_pool():
+    """Запуск процессов model_executor при старте сервиса, а не на первом сканировании.
+    Вызывается после загрузки модели в основном процессе: при fork процессы получают её готовой"""
+    if SCAN_EXECUTOR == "thread":
+        return
+    start = time.time()
+    loop = asyncio.get_running_loop()
+    # Одновременные задачи - пул создаёт процессы, пока не будет SCAN_WORKERS свободных
+    pids = await asyncio.gather(*(loop.run_in_executor(model_executor, scan_worker.ping) for _ in range(SCAN_WORKERS)))
+    logger.info(f"Процессы сканирования запущены: {len(set(pids))} (время: {time.time() - start:.2f}с)")
+
+# Ограничения по этапам: задача держит слот только на время своего этапа, поэтому пока одни
+# репозитории сканируются, другие уже скачиваются (а отправка callback'а не занимает ни один слот).
+# Общее число задач в работе ограничено числом воркеров очереди
+MAX_CONCURRENT_SCANS = int(os.getenv("MAX_CONCURRENT_SCANS", "8"))
+processing_semaphore = asyncio.Semaphore(MAX_CONCURRENT_SCANS)
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", str(MAX_CONCURRENT_SCANS)))
+download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+
+# Пул рабочих директорий: создаются при старте и переиспользуются, очистка содержимого
+# идёт в отдельном cleanup_executor, не задерживая слот сканирования и потоки скачивания
+WORKDIR_POOL_SIZE = MAX_CONCURRENT_SCANS
+CLEANUP_WORKERS = int(os.getenv("CLEANUP_WORKERS", "2"))
+cleanup_executor = ThreadPoolExecutor(max_workers=CLEANUP_WORKERS, thread_name_prefix="cleanup")
+_workdir_pool = asyncio.Queue()
+# Все существующие рабочие директории (в пуле, выданные и ожидающие очистки) -
+# при остановке удаляются целиком, даже если release_workdir не успел выполниться
+_workdirs = set()
+_shutting_down = False
+
+def _new_workdir(base: str) -> str:
+    path = tempfile.mkdtemp(prefix="scan_", dir=base)
+    _workdirs.add(path)
+    return path
+
+def _delete_workdirs():
+    """Удалить все рабочие директории сервиса"""
+    for path in list(_workdirs):
+        delete_dir(path)
+        _workdirs.discard(path)
+
+# Финальный проход после завершения потоков: скачивание, не успевшее остановиться
+# к моменту cleanup_executors, могло снова что-то записать в рабочую директорию
+atexit.register(_delete_workdirs)
+
+def _wipe_contents(path: str):
+    """Удалить содержимое директории, оставив саму директорию.
+    Ошибки удаления не игнорируются: директория с файлами предыдущего скана не должна вернуться в пул"""
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+    if os.listdir(path):
+        raise OSError("директория не пуста после очистки")
+
+def init_workdir_pool():
+    """Создание рабочих директорий при старте сервиса"""
+    if not _has_free_space(TEMP_DIR, 2 * WORKDIR_MIN_FREE):
+        free_mb = shutil.disk_usage(TEMP_DIR).free // (1024 * 1024)
+        logger.warning(f"В {TEMP_DIR} свободно всего {free_mb} MB - крупные репозитории будут распаковываться в {DISK_TEMP_DIR}. "
+                       f"Увеличьте объём или укажите другую папку в TEMP_DIR")
+    for _ in range(WORKDIR_POOL_SIZE):
+        _workdir_pool.put_nowait(_new_workdir(TEMP_DIR))
+    logger.info(f"Создано {WORKDIR_POOL_SIZE} рабочих директорий в {TEMP_DIR}")
+
+def _has_free_space(path: str, required: int) -> bool:
+    try:
+        return shutil.disk_usage(path).free >= required
+    except OSError:
+        return True
+
+async def acquire_workdir(required_bytes: int = 0) -> str:
+    """Получить чистую рабочую директорию (новую, если все заняты или ещё очищаются).
+    Если в TEMP_DIR не хватает места под required_bytes, директория создаётся в DISK_TEMP_DIR"""
+    if TEMP_DIR != DISK_TEMP_DIR and not _has_free_space(TEMP_DIR, max(required_bytes, WORKDIR_MIN_FREE)):
+        logger.warning(f"В {TEMP_DIR} недостаточно места - рабочая директория создаётся в {DISK_TEMP_DIR}")
+        return _new_workdir(DISK_TEMP_DIR)
+    try:
+        return _workdir_pool.get_nowait()
+    except asyncio.QueueEmpty:
+        return _new_workdir(TEMP_DIR)
+
+async def _remove_workdir(path: str):
+    await asyncio.get_running_loop().run_in_executor(cleanup_executor, delete_dir, path)
+    _workdirs.discard(path)
+
+async def release_workdir(path: str):
+    """Очистить директорию в cleanup_executor и вернуть её в пул"""
+    if _shutting_down:
+        # cleanup_executors удаляет все директории сам
+        return
+    loop = asyncio.get_running_loop()
+    # Директории вне TEMP_DIR (запасные на диске) и лишние сверх размера пула удаляются
+    if os.path.dirname(path) != TEMP_DIR or _workdir_pool.qsize() >= WORKDIR_POOL_SIZE:
+        await _remove_workdir(path)
+        return
+    try:
+        await loop.run_in_executor(cleanup_executor, _wipe_contents, path)
+        _workdir_pool.put_nowait(path)
+    except Exception as e:
+        # Директория в пул не возвращается - при нехватке acquire_workdir создаст новую
+        logger.error(f"Ошибка при очистке рабочей директории {path}: {e}")
+        await _remove_workdir(path)
 
-# Process pool for CPU-intensive operations (model inference)
-model_executor = ProcessPoolExecutor(max_workers=multiprocessing.cpu_count())
+# LRU-кеш результатов сканирования: повторный скан того же коммита (или того же ZIP)
+# отдаётся без скачивания и сканирования. Ключ включает отпечаток файлов настроек и ML модели,
+# поэтому изменение правил через API или переобучение модели делает старые записи недостижимыми
+RESULTS_CACHE_SIZE = int(os.getenv("RESULTS_CACHE_SIZE", "128"))
+_results_cache = OrderedDict()
+_RULES_FILES = (
+    "Settings/rules.yml",
+    "Settings/excluded_files.yml",
+    "Settings/excluded_extensions.yml",
+    "Settings/false-positive.yml",
+    # Модель и векторизатор определяют severity каждой находки
+    "Model/secret_detector_model.pkl",
+    "Model/vectorizer.pkl",
+)
+
+def _rules_fingerprint() -> tuple:
+    fingerprint = []
+    for path in _RULES_FILES:
+        try:
+            stat = os.stat(path)
+            fingerprint.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            fingerprint.append(None)
+    return tuple(fingerprint)
+
+def results_cache_key(key: tuple):
+    """Полный ключ кеша (или None, если кеш отключен)"""
+    if RESULTS_CACHE_SIZE <= 0:
+        return None
+    return key, _rules_fingerprint()
+
+def get_cached_results(cache_key):
+    if cache_key is None:
+        return None
+    scan_result = _results_cache.get(cache_key)
+    if scan_result is not None:
+        _results_cache.move_to_end(cache_key)
+    return scan_result
+
+def put_cached_results(cache_key, scan_result: tuple):
+    if cache_key is None:
+        return
+    results = scan_result[0]
+    # Ошибку процесса сканирования не кешируем
+    if results and results[0].get("path") == "process_error":
+        return
+    _results_cache[cache_key] = scan_result
+    _results_cache.move_to_end(cache_key)
+    while len(_results_cache) > RESULTS_CACHE_SIZE:
+        _results_cache.popitem(last=False)
+
+def _hash_zip_content(zip_content: bytes) -> str:
+    return hashlib.blake2b(zip_content, digest_size=16).hexdigest()
+
+def build_results_payload(project_name: str, repo_url: str, commit: str, scan_result: tuple) -> dict:
+    """Payload callback'а с результатами сканирования"""
+    results, files_excluded, all_files_count, skipped_files, detected_languages, detected_frameworks = scan_result
+    return {
+        "Status": "completed",
+        "Message": "Scanned Successfully",
+        "ProjectName": project_name,
+        "ProjectRepoUrl": repo_url,
+        "RepoCommit": commit,
+        "Results": results,
+        "FilesExcluded": files_excluded,
+        "AllFiles": all_files_count,
+        "SkippedFiles": skipped_files,
+        "DetectedLanguages": detected_languages,
+        "DetectedFrameworks": detected_frameworks
+    }
+
+# Фоновые задачи (очистка рабочих директорий) - храним ссылки, чтобы отменить их при остановке
+active_tasks = set()
+
+def _on_task_done(task: asyncio.Task):
+    active_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Фоновая задача завершилась с ошибкой: {task.exception()}")
+
+def spawn_task(coro) -> asyncio.Task:
+    """Запуск фоновой задачи с учётом в active_tasks"""
+    task = asyncio.create_task(coro)
+    active_tasks.add(task)
+    task.add_done_callback(_on_task_done)
+    return task
+
+# Общая HTTP-сессия для callback'ов: пул соединений и keep-alive вместо
+# нового TCP/TLS-подключения на каждую отправку
+_session = None
 
+async def get_session() -> aiohttp.ClientSession:
+    """Ленивое создание общей aiohttp-сессии (в контексте запущенного event loop)"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(
+                total=CALLBACK_ATTEMPT_TIMEOUT,
+                connect=10,
+                sock_read=30
+            ),
+            connector=aiohttp.TCPConnector(
+                limit=100,
+                limit_per_host=10,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+        )
+    return _session
+
+class TaskKind(IntEnum):
+    """Тип задачи в task_queue. Элемент очереди - (TaskKind, *аргументы обработчика)"""
+    SINGLE = 0
+    MULTI = 1
+    LOCAL = 2
+
+# Постановка в очередь не ждёт свободного места: при заполненной очереди поднимается
+# asyncio.QueueFull, и API отвечает 429
 async def add_to_queue_background(request: ScanRequest, commit: str):
-    await task_queue.put((request, commit))
+    task_queue.put_nowait((TaskKind.SINGLE, request, commit))
     logger.info(f"Проект {request.ProjectName} поставлен в очередь на сканирование")
 
-async def add_multi_scan_to_queue(multi_scan_items: list, commits: list):
+async def add_multi_scan_to_queue(multi_scan_items: list, commits: list, batch_callback: bool = False):
     """Add multi-scan sequence to queue"""
-    await task_queue.put(("multi_scan", multi_scan_items, commits))
+    task_queue.put_nowait((TaskKind.MULTI, multi_scan_items, commits, batch_callback))
     logger.info(f"Мультисканирование {len(multi_scan_items)} проектов поставлено в очередь")
 
+async def add_local_scan_to_queue(request_dict: dict, zip_content: bytes):
+    """Add uploaded zip scan to queue"""
+    task_queue.put_nowait((TaskKind.LOCAL, request_dict, zip_content))
+    logger.info(f"Локальное сканирование {request_dict['ProjectName']} поставлено в очередь")
+
 async def start_worker():
-    """Worker that processes requests concurrently"""
+    """Worker that processes queued requests one at a time.
+    Параллельность задаётся числом воркеров (MAX_WORKERS): воркер не берёт следующую задачу,
+    пока не закончит текущую, поэтому при перегрузке заполняется task_queue и API отвечает 429"""
     while True:
         try:
-            # Добавляем timeout для избежания вечного ожидания
-            item = await asyncio.wait_for(task_queue.get(), timeout=5.0)
-            
-            # Check item type
-            if isinstance(item, tuple) and len(item) == 3:
-                if item[0] == "multi_scan":
-                    # Multi-scan processing
-                    _, multi_scan_items, commits = item
-                    asyncio.create_task(process_multi_scan_sequence(multi_scan_items, commits))
-                elif item[0] == "local_scan":
-                    # Local scan processing
-                    _, request_dict, zip_content = item
-                    asyncio.create_task(process_local_scan_async(request_dict, zip_content))
-            else:
-                # Single scan processing
-                request, commit = item
-                asyncio.create_task(process_request_async(request, commit))
-            
-            task_queue.task_done()
-        except asyncio.TimeoutError:
-            # Периодически проверяем, не нужно ли завершиться
-            continue
+            kind, *args = await task_queue.get()
+        except asyncio.CancelledError:
+            logger.info("Worker получил сигнал отмены")
+            break
+        
+        # Ошибка одного элемента не останавливает воркер - переходим к следующему
+        try:
+            await TASK_HANDLERS[kind](*args)
         except asyncio.CancelledError:
             logger.info("Worker получил сигнал отмены")
             break
         except Exception as e:
-            logger.error(f"Worker error: {e}")
-            await asyncio.sleep(1)
+            logger.exception(f"Worker error: {e}")
+        finally:
+            task_queue.task_done()
+
+# Репозитории с числом файлов не больше порога сканируются в потоке основного процесса:
+# для них передача задачи в процесс пула дороже самого сканирования. Число файлов известно
+# после распаковки (None - неизвестно, сканируем в model_executor). Для таких сканов - свой
+# небольшой пул, чтобы они не занимали потоки скачивания и не нагружали GIL основного процесса
+SMALL_REPO_THRESHOLD = 200
+SMALL_SCAN_WORKERS = 2
+small_scan_executor = ThreadPoolExecutor(max_workers=SMALL_SCAN_WORKERS, thread_name_prefix="small-scan")
+
+async def run_scan_task(repo_path: str, project_name: str, file_count: int = None) -> tuple:
+    """Сканирование + фильтрация моделью: маленькие репозитории - в small_scan_executor, остальные - в model_executor"""
+    loop = asyncio.get_running_loop()
+    if SCAN_EXECUTOR != "thread" and file_count is not None and file_count <= SMALL_REPO_THRESHOLD:
+        return await loop.run_in_executor(small_scan_executor, scan_worker.run_scan, repo_path, project_name)
+    return await loop.run_in_executor(model_executor, scan_worker.run_scan, repo_path, project_name)
 
 async def process_local_scan_async(request_dict: dict, zip_content: bytes):
     """Process uploaded zip file locally"""
+    loop = asyncio.get_running_loop()
     start_time = time.time()
-    temp_dir = tempfile.mkdtemp(dir=os.getenv("TEMP_DIR", "C:\\"))
+    temp_dir = None
     
     try:
         project_name = request_dict["ProjectName"]
@@ -94,26 +386,34 @@ async def process_local_scan_async(request_dict: dict, zip_content: bytes):
         
         logger.info(f"Начинаю локальное сканирование {project_name}")
         
-        # Save zip content to file
-        zip_save_start = time.time()
-        zip_path = os.path.join(temp_dir, f"{project_name}.zip")
-        with open(zip_path, 'wb') as f:
-            f.write(zip_content)
+        cache_key = None
+        if RESULTS_CACHE_SIZE > 0:
+            zip_hash = await loop.run_in_executor(None, _hash_zip_content, zip_content)
+            cache_key = results_cache_key(("local", zip_hash))
+        scan_result = get_cached_results(cache_key)
+        if scan_result is not None:
+            logger.info(f"Результаты {project_name} взяты из кеша (ZIP уже сканировался)")
+            await send_callback(callback_url, build_results_payload(project_name, request_dict["RepoUrl"], commit, scan_result))
+            return
         
-        logger.info(f"ZIP файл сохранен: {project_name} (время: {time.time() - zip_save_start:.2f}с)")
+        # Рабочая директория берётся только при промахе кеша.
+        # Архив + распакованные файлы (+ копия архива для распаковки в процессах)
+        temp_dir = await acquire_workdir(3 * len(zip_content))
         
-        # Extract zip file
+        # Extract zip file - напрямую из памяти, без записи архива на диск
         extract_start = time.time()
         extracted_path = os.path.join(temp_dir, "extracted")
         os.makedirs(extracted_path, exist_ok=True)
         
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            download_executor,
-            extract_zip_file,
-            zip_path,
-            extracted_path
-        )
+        async with download_semaphore:
+            file_count = await loop.run_in_executor(
+                download_executor,
+                extract_zip_from_bytes,
+                zip_content,
+                extracted_path
+            )
+        # Архив больше не нужен - освобождаем память до этапа сканирования
+        del zip_content
         
         logger.info(f"ZIP файл распакован: {project_name} (время: {time.time() - extract_start:.2f}с)")
         
@@ -121,32 +421,15 @@ async def process_local_scan_async(request_dict: dict, zip_content: bytes):
         scan_start = time.time()
         logger.info(f"Сканирую {project_name}")
         
-        results, files_excluded, all_files_count, skipped_files, detected_languages, detected_frameworks  = await loop.run_in_executor(
-            model_executor,
-            scan_repo_with_model,
-            extracted_path,
-            project_name,
-            request_dict
-        )
+        async with processing_semaphore:
+            scan_result = await run_scan_task(extracted_path, project_name, file_count)
+        put_cached_results(cache_key, scan_result)
         
         scan_time = time.time() - scan_start
-        logger.info(f"Просканировано {project_name} (время: {scan_time:.2f}с, файлов: {files_excluded}/{all_files_count})")
+        logger.info(f"Просканировано {project_name} (время: {scan_time:.2f}с, файлов: {scan_result[1]}/{scan_result[2]})")
         
         # Send results
-        payload = {
-            "Status": "completed",
-            "Message": "Scanned Successfully",
-            "ProjectName": project_name,
-            "ProjectRepoUrl": request_dict["RepoUrl"],
-            "RepoCommit": commit,
-            "Results": results,
-            "FilesExcluded": files_excluded,
-            "AllFiles": all_files_count,
-            "SkippedFiles": skipped_files,
-            "DetectedLanguages": detected_languages,
-            "DetectedFrameworks": detected_frameworks
-        }
-        
+        payload = build_results_payload(project_name, request_dict["RepoUrl"], commit, scan_result)
         await send_callback(callback_url, payload)
         
         total_time = time.time() - start_time
@@ -156,187 +439,167 @@ async def process_local_scan_async(request_dict: dict, zip_content: bytes):
         logger.error(f"Ошибка при локальном сканировании {request_dict.get('ProjectName', 'unknown')}: {e}")
         await send_error_callback(request_dict.get("CallbackUrl", ""), str(e))
     finally:
-        # Cleanup
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(download_executor, delete_dir, temp_dir)
+        # Очистка в фоне: воркер освобождается, не дожидаясь удаления файлов
+        if temp_dir:
+            spawn_task(release_workdir(temp_dir))
 
-def extract_zip_file(zip_path: str, extract_path: str):
-    """Extract zip file synchronously"""
+def extract_zip_from_bytes(zip_bytes: bytes, extract_path: str) -> int:
+    """Extract zip archive from memory synchronously (записи распаковываются параллельно
+    в extract_executor, большие архивы - в extract_process_executor). Возвращает число файлов"""
     try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_file:
-            zip_file.extractall(extract_path)
-        return True
+        with zipfile.ZipFile(io.BytesIO(zip_bytes), 'r') as zip_file:
+            if extract_process_executor is not None and len(zip_bytes) >= EXTRACT_PROCESS_THRESHOLD:
+                # Процессам передаём путь, а не bytes - иначе архив копировался бы в каждый процесс
+                zip_path = os.path.join(os.path.dirname(extract_path), "upload.zip")
+                with open(zip_path, 'wb') as f:
+                    f.write(zip_bytes)
+                try:
+                    return safe_extract(zip_file, extract_path, source=zip_path,
+                                        executor=extract_process_executor, parts=EXTRACT_PROCESSES)
+                finally:
+                    os.unlink(zip_path)
+            
+            return safe_extract(zip_file, extract_path, source=zip_bytes)
     except Exception as e:
         logger.error(f"Ошибка при распаковке ZIP: {e}")
         raise e
 
-async def process_multi_scan_sequence(multi_scan_items: list, commits: list):
-    """Process multi-scan repositories sequentially"""
+# Сколько репозиториев мультискана обрабатываются (скачиваются и сканируются) одновременно
+MULTI_SCAN_CONCURRENCY = int(os.getenv("MAX_MULTI_CONCURRENCY", str(min(4, multiprocessing.cpu_count()))))
+
+async def process_multi_scan_sequence(multi_scan_items: list, commits: list, batch_callback: bool = False):
+    """Process multi-scan repositories concurrently (не больше MULTI_SCAN_CONCURRENCY одновременно).
+    При batch_callback результаты с одинаковым CallbackUrl отправляются одним запросом в конце"""
     multi_start_time = time.time()
-    logger.info(f"Начинаю последовательное мультисканирование {len(multi_scan_items)} репозиториев")
+    total = len(multi_scan_items)
+    logger.info(f"Начинаю мультисканирование {total} репозиториев")
     
-    for i, (item_dict, commit) in enumerate(zip(multi_scan_items, commits)):
-        try:
-            # Convert dict back to ScanRequest
-            from app.models import ScanRequest
-            request = ScanRequest(**item_dict)
+    multi_semaphore = asyncio.Semaphore(MULTI_SCAN_CONCURRENCY)
+    # CallbackUrl -> payload'ы для пакетной отправки
+    batched_payloads = {}
+    
+    async def run_one(i: int, item_dict: dict, commit: str):
+        async with multi_semaphore:
+            try:
+                request = ScanRequest(**item_dict)
+            except Exception as e:
+                logger.error(f"Ошибка в мультискане [{i+1}/{total}]: {e}")
+                return
             
+            logger.info(f"Мультискан [{i+1}/{total}]: {request.ProjectName}")
             item_start = time.time()
-            logger.info(f"Мультискан [{i+1}/{len(multi_scan_items)}]: {request.ProjectName}")
-            
-            # Process sequentially (wait for completion)
-            await process_request_sequential(request, commit)
+            cache_key = results_cache_key(("remote", request.RepoUrl, commit))
+            scan_result = get_cached_results(cache_key)
+            temp_dir = None
+            try:
+                extracted_repo_path, file_count = None, None
+                if scan_result is None:
+                    temp_dir = await acquire_workdir()
+                    async with download_semaphore:
+                        extracted_repo_path, file_count = await download_for_multi_scan(request, commit, temp_dir)
+                    if not extracted_repo_path:
+                        return
+                
+                payload = await scan_and_send_multi_scan(request, commit, cache_key, scan_result, extracted_repo_path, file_count, send=not batch_callback)
+                if payload is not None:
+                    batched_payloads.setdefault(request.CallbackUrl, []).append(payload)
+            except Exception as e:
+                # Например, не удалось создать рабочую директорию (ENOSPC/EACCES) - сообщаем об ошибке этого репозитория
+                logger.error(f"Ошибка при обработке {request.ProjectName}: {e}")
+                await send_error_callback(request.CallbackUrl, f"Ошибка мультисканирования: {str(e)}")
+                return
+            finally:
+                if temp_dir:
+                    spawn_task(release_workdir(temp_dir))
             
             item_time = time.time() - item_start
-            logger.info(f"Мультискан [{i+1}/{len(multi_scan_items)}] завершен: {request.ProjectName} (время: {item_time:.2f}с)")
-            
-        except Exception as e:
-            logger.error(f"Ошибка в мультискане [{i+1}/{len(multi_scan_items)}]: {e}")
-            # Continue with next repository even if one fails
-            try:
-                if 'request' in locals():
-                    await send_error_callback(request.CallbackUrl, f"Ошибка мультисканирования: {str(e)}")
-            except:
-                pass
+            logger.info(f"Мультискан [{i+1}/{total}] завершен: {request.ProjectName} (время: {item_time:.2f}с)")
+    
+    # Ошибка одного репозитория не отменяет остальные
+    outcomes = await asyncio.gather(
+        *(run_one(i, item_dict, commit) for i, (item_dict, commit) in enumerate(zip(multi_scan_items, commits))),
+        return_exceptions=True
+    )
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            logger.error(f"Ошибка в мультискане: {outcome}")
+    
+    for callback_url, payloads in batched_payloads.items():
+        await send_batched_callback(callback_url, payloads)
     
     total_multi_time = time.time() - multi_start_time
-    logger.info(f"Мультисканирование завершено: {len(multi_scan_items)} репозиториев (общее время: {total_multi_time:.2f}с)")
+    logger.info(f"Мультисканирование завершено: {total} репозиториев (общее время: {total_multi_time:.2f}с)")
 
-async def process_request_sequential(request: ScanRequest, commit: str):
-    """Sequential processing for multi-scan (blocks until complete)"""
-    temp_dir = tempfile.mkdtemp(dir=os.getenv("TEMP_DIR", "C:\\"))
+async def download_for_multi_scan(request: ScanRequest, commit: str, temp_dir: str) -> tuple:
+    """Download step of multi-scan. Возвращает (путь к распакованному репозиторию, число файлов)
+    или ("", None) - callback с ошибкой уже отправлен"""
+    download_start = time.time()
+    logger.info(f"Скачиваю {request.ProjectName}")
     
     try:
-        # Step 1: Download repository
-        download_start = time.time()
-        logger.info(f"Скачиваю {request.ProjectName}")
-        loop = asyncio.get_event_loop()
-        
-        extracted_repo_path, status_message = await loop.run_in_executor(
-            download_executor, 
-            download_repo_sync, 
-            request.RepoUrl, 
-            commit, 
-            temp_dir
-        )
-        
-        if not extracted_repo_path:
-            await send_error_callback(request.CallbackUrl, status_message)
-            return
+        extracted_repo_path, status_message, file_count = await download_repo(request.RepoUrl, commit, temp_dir)
+    except Exception as e:
+        extracted_repo_path, status_message, file_count = "", f"Ошибка мультисканирования: {str(e)}", None
+    
+    if not extracted_repo_path:
+        logger.error(f"Ошибка при скачивании {request.ProjectName}: {status_message}")
+        await send_error_callback(request.CallbackUrl, status_message)
+        return "", None
+    
+    download_time = time.time() - download_start
+    logger.info(f"Скачано {request.ProjectName} (время: {download_time:.2f}с)")
+    return extracted_repo_path, file_count
+
+async def scan_and_send_multi_scan(request: ScanRequest, commit: str, cache_key, scan_result, extracted_repo_path: str, file_count: int = None, send: bool = True):
+    """Scan + callback step of multi-scan (scan_result - результаты из кеша, если есть).
+    При send=False callback не отправляется, а payload возвращается для пакетной отправки"""
+    try:
+        if scan_result is not None:
+            logger.info(f"Результаты {request.ProjectName} взяты из кеша ({request.RepoUrl}@{commit[:7]})")
+        else:
+            scan_start = time.time()
+            logger.info(f"Сканирую {request.ProjectName}")
             
-        download_time = time.time() - download_start
-        logger.info(f"Скачано {request.ProjectName} (время: {download_time:.2f}с)")
-        
-        # Step 2: Scan repository
-        scan_start = time.time()
-        logger.info(f"Сканирую {request.ProjectName}")
-        
-        request_dict = {
-            "ProjectName": request.ProjectName,
-            "RepoUrl": request.RepoUrl,
-            "RefType": request.RefType,
-            "Ref": request.Ref,
-            "CallbackUrl": request.CallbackUrl
-        }
-        
-        results, files_excluded, all_files_count, skipped_files, detected_languages, detected_frameworks = await loop.run_in_executor(
-            model_executor,
-            scan_repo_with_model,
-            extracted_repo_path,
-            request.ProjectName,
-            request_dict
-        )
-        
-        scan_time = time.time() - scan_start
-        logger.info(f"Просканировано {request.ProjectName} (время: {scan_time:.2f}с, файлов: {files_excluded}/{all_files_count})")
-        
-        # Step 3: Send results
-        payload = {
-            "Status": "completed",
-            "Message": "Scanned Successfully",
-            "ProjectName": request.ProjectName,
-            "ProjectRepoUrl": request.RepoUrl,
-            "RepoCommit": commit,
-            "Results": results,
-            "FilesExcluded": files_excluded,
-            "AllFiles": all_files_count,
-            "SkippedFiles": skipped_files,
-            "DetectedLanguages": detected_languages,
-            "DetectedFrameworks": detected_frameworks
-        }
+            async with processing_semaphore:
+                scan_result = await run_scan_task(extracted_repo_path, request.ProjectName, file_count)
+            put_cached_results(cache_key, scan_result)
+            
+            scan_time = time.time() - scan_start
+            logger.info(f"Просканировано {request.ProjectName} (время: {scan_time:.2f}с, файлов: {scan_result[1]}/{scan_result[2]})")
         
+        payload = build_results_payload(request.ProjectName, request.RepoUrl, commit, scan_result)
+        if not send:
+            return payload
         await send_callback(request.CallbackUrl, payload)
         logger.info(f"Результаты отправлены для {request.ProjectName}")
         
     except Exception as e:
         logger.error(f"Ошибка при обработке {request.ProjectName}: {e}")
         await send_error_callback(request.CallbackUrl, str(e))
-    finally:
-        # Cleanup
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(download_executor, delete_dir, temp_dir)
-
-def download_repo_sync(repo_url: str, commit: str, temp_dir: str) -> Tuple[str, str]:
-    """Synchronous wrapper for download_repo to run in thread pool"""
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        result = loop.run_until_complete(download_repo(repo_url, commit, temp_dir))
-        return result
-    finally:
-        loop.close()
-
-def scan_repo_with_model(repo_path: str, project_name: str, request_dict: dict) -> Tuple[list, int, int, str, dict, dict]:
-    """Process scanning and model inference in separate process"""
-    import sys
-    import os
-    import asyncio
-    
-    # Add the project root to Python path
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    if project_root not in sys.path:
-        sys.path.insert(0, project_root)
-    
-    try:
-        from app.scanner import scan_repo_without_callback
-        from app.model_loader import get_model_instance, filter_secrets_in_process
-        from app.models import ScanRequest
-        
-        # Recreate request object from dict
-        request = ScanRequest(**request_dict)
-        
-        # Perform scanning without model (in process)
-        results, files_excluded, file_count, skipped_files, detected_languages, detected_frameworks = asyncio.run(scan_repo_without_callback(request, repo_path, project_name))
-        
-        # Apply model filtering
-        filtered_results = filter_secrets_in_process(project_name, results)
-        
-        return filtered_results, files_excluded, file_count, skipped_files, detected_languages, detected_frameworks
-        
-    except Exception as e:
-        logger.error(f"Ошибка в процессе сканирования: {e}")
-        # Return empty results with error info
-        return [{"error": str(e), "path": "process_error", "severity": "High", "Type": "Process Error"}], 0, 0, "", {}, {}
+    return None
 
 async def process_request_async(request: ScanRequest, commit: str):
     """Async processing with concurrent download and scanning"""
     start_time = time.time()
-    temp_dir = tempfile.mkdtemp(dir=os.getenv("TEMP_DIR", "C:\\"))
+    temp_dir = None
     
     try:
+        cache_key = results_cache_key(("remote", request.RepoUrl, commit))
+        scan_result = get_cached_results(cache_key)
+        if scan_result is not None:
+            logger.info(f"Результаты {request.ProjectName} взяты из кеша ({request.RepoUrl}@{commit[:7]})")
+            await send_callback(request.CallbackUrl, build_results_payload(request.ProjectName, request.RepoUrl, commit, scan_result))
+            return
+        
+        # Рабочая директория берётся только при промахе кеша
+        temp_dir = await acquire_workdir()
+        
         # Step 1: Download repository in thread pool (non-blocking)
         download_start = time.time()
         logger.info(f"Начинаю скачивание {request.ProjectName}")
-        loop = asyncio.get_event_loop()
         
-        extracted_repo_path, status_message = await loop.run_in_executor(
-            download_executor, 
-            download_repo_sync, 
-            request.RepoUrl, 
-            commit, 
-            temp_dir
-        )
+        async with download_semaphore:
+            extracted_repo_path, status_message, file_count = await download_repo(request.RepoUrl, commit, temp_dir)
         
         if not extracted_repo_path:
             await send_error_callback(request.CallbackUrl, status_message)
@@ -349,41 +612,15 @@ async def process_request_async(request: ScanRequest, commit: str):
         scan_start = time.time()
         logger.info(f"Начинаю сканирование {request.ProjectName}")
         
-        # Convert request to dict for multiprocessing
-        request_dict = {
-            "ProjectName": request.ProjectName,
-            "RepoUrl": request.RepoUrl,
-            "RefType": request.RefType,
-            "Ref": request.Ref,
-            "CallbackUrl": request.CallbackUrl
-        }
-        
-        results, files_excluded, all_files_count, skipped_files, detected_languages, detected_frameworks = await loop.run_in_executor(
-            model_executor,
-            scan_repo_with_model,
-            extracted_repo_path,
-            request.ProjectName,
-            request_dict
-        )
+        async with processing_semaphore:
+            scan_result = await run_scan_task(extracted_repo_path, request.ProjectName, file_count)
+        put_cached_results(cache_key, scan_result)
         
         scan_time = time.time() - scan_start
-        logger.info(f"Сканирование завершено {request.ProjectName} (время: {scan_time:.2f}с, файлов: {files_excluded}/{all_files_count})")
+        logger.info(f"Сканирование завершено {request.ProjectName} (время: {scan_time:.2f}с, файлов: {scan_result[1]}/{scan_result[2]})")
         
         # Step 3: Send results
-        payload = {
-            "Status": "completed",
-            "Message": "Scanned Successfully",
-            "ProjectName": request.ProjectName,
-            "ProjectRepoUrl": request.RepoUrl,
-            "RepoCommit": commit,
-            "Results": results,
-            "FilesExcluded": files_excluded,
-            "AllFiles": all_files_count,
-            "SkippedFiles": skipped_files,
-            "DetectedLanguages": detected_languages,
-            "DetectedFrameworks": detected_frameworks
-        }
-        
+        payload = build_results_payload(request.ProjectName, request.RepoUrl, commit, scan_result)
         await send_callback(request.CallbackUrl, payload)
         
         total_time = time.time() - start_time
@@ -393,113 +630,255 @@ async def process_request_async(request: ScanRequest, commit: str):
         logger.error(f"Ошибка при обработке {request.ProjectName}: {e}")
         await send_error_callback(request.CallbackUrl, str(e))
     finally:
-        # Cleanup in thread pool to avoid blocking
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(download_executor, delete_dir, temp_dir)
+        # Очистка в фоне: воркер освобождается, не дожидаясь удаления файлов
+        if temp_dir:
+            spawn_task(release_workdir(temp_dir))
 
-async def send_callback(callback_url: str, payload: dict):
-    """Send callback with compression support"""
-    
-    project_name = payload.get("ProjectName", "unknown")
-    results_count = len(payload.get("Results", []))
-    
-    # Сериализуем payload
-    payload_json = json.dumps(payload, ensure_ascii=False)
-    original_size = len(payload_json.encode('utf-8'))
+if orjson is not None:
+    # orjson: numpy-значения из ML-модели сериализуются напрямую, ключи-не-строки приводятся к строкам
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=ORJSON_OPTIONS)
+else:
+    logger.warning("orjson не установлен - для callback используется стандартный json (медленнее)")
+
+    def _json_default(value):
+        # numpy-скаляры и массивы из ML-модели
+        if hasattr(value, "tolist"):
+            return value.tolist()
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+# Размер порции (в байтах сжатых данных), отправляемой в теле callback'а
+CALLBACK_CHUNK_SIZE = 64 * 1024
+CALLBACK_COMPRESS_LEVEL = 6
+
+# Формат тела callback'а:
+#   gzip-base64 - JSON-обёртка {"compressed": true, "data": <base64>, ...} с заголовком X-Compressed (по умолчанию)
+#   gzip        - сжатый JSON напрямую с Content-Encoding: gzip (на ~25% меньше, получатель должен это поддерживать)
+#   zstd        - то же с Content-Encoding: zstd (быстрее и плотнее gzip, нужен пакет zstandard)
+CALLBACK_ENCODING = os.getenv("CALLBACK_ENCODING", "gzip-base64").lower()
+
+_zstd_compressor = None
+if CALLBACK_ENCODING == "zstd":
+    try:
+        import zstandard
+        # Один компрессор на модуль; threads=-1 - сжатие на всех ядрах
+        _zstd_compressor = zstandard.ZstdCompressor(level=3, threads=-1)
+    except ImportError:
+        logger.warning("CALLBACK_ENCODING=zstd, но пакет zstandard не установлен - используется gzip")
+        CALLBACK_ENCODING = "gzip"
+
+def _iter_payload_json(payload: dict):
+    """Сериализация payload по частям (bytes): каждый элемент Results кодируется отдельно,
+    чтобы не держать в памяти весь JSON одной строкой"""
+    results = payload.get("Results")
+    if not isinstance(results, list):
+        yield _dumps(payload)
+        return
     
-    # Сжимаем данные
-    compressed_data = gzip.compress(payload_json.encode('utf-8'))
-    compressed_size = len(compressed_data)
+    meta = {key: value for key, value in payload.items() if key != "Results"}
+    head = _dumps(meta)
+    yield head[:-1] + (b',' if meta else b'') + b'"Results":['
+    for i, row in enumerate(results):
+        yield (b',' if i else b'') + _dumps(row)
+    yield b']}'
+
+# Неиспользуемый шаблон компрессора: каждый callback получает его копию, параметры
+# (уровень, wbits=31 - формат gzip) разбираются и проверяются один раз при импорте
+_GZIP_TEMPLATE = zlib.compressobj(CALLBACK_COMPRESS_LEVEL, zlib.DEFLATED, 31)
+
+def _gzip_compressor():
+    return _GZIP_TEMPLATE.copy()
+
+def _iter_compressed_chunks(payload: dict, stats: dict, compressor):
+    """JSON payload -> сжатые порции не меньше CALLBACK_CHUNK_SIZE (последняя - остаток).
+    compressor - объект с compress()/flush() (zlib.compressobj или zstd compressobj)"""
+    pending = bytearray()
+    original_size = 0
     
-    # Кодируем в base64 для передачи
-    compressed_b64 = base64.b64encode(compressed_data).decode('ascii')
+    for raw in _iter_payload_json(payload):
+        original_size += len(raw)
+        pending += compressor.compress(raw)
+        if len(pending) >= CALLBACK_CHUNK_SIZE:
+            yield pending
+            pending = bytearray()
     
-    # Создаем сжатый payload
-    compressed_payload = {
+    pending += compressor.flush()
+    stats["original_size"] = original_size
+    yield pending
+
+# Сериализация и сжатие результатов - в отдельном пуле: большой callback не блокирует event loop
+# и не занимает потоки скачивания (download_executor - пул по умолчанию)
+CALLBACK_WORKERS = 2
+callback_executor = ThreadPoolExecutor(max_workers=CALLBACK_WORKERS, thread_name_prefix="callback")
+
+async def _aiter_compressed_chunks(payload: dict, stats: dict, compressor):
+    """_iter_compressed_chunks, выполняемый порциями в callback_executor (порция - до CALLBACK_CHUNK_SIZE сжатых данных)"""
+    loop = asyncio.get_running_loop()
+    chunks = _iter_compressed_chunks(payload, stats, compressor)
+    while True:
+        chunk = await loop.run_in_executor(callback_executor, next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def _build_compressed_payload(payload: dict, stats: dict) -> bytes:
+    """
+    Тело callback'а в формате gzip-base64 целиком (bytes - aiohttp выставит Content-Length):
+    {"compressed": true, "data": <gzip+base64>, "original_size", "compressed_size"}.
+    Выполняется в callback_executor; размеры накапливаются в stats для логирования.
+    """
+    compressed = b"".join(_iter_compressed_chunks(payload, stats, _gzip_compressor()))
+    stats["compressed_size"] = len(compressed)
+    body = json.dumps({
         "compressed": True,
-        "data": compressed_b64,
-        "original_size": original_size,
-        "compressed_size": compressed_size
-    }
-    
-    compressed_json = json.dumps(compressed_payload)
-    final_size = len(compressed_json.encode('utf-8'))
+        "data": base64.b64encode(compressed).decode('ascii'),
+        "original_size": stats["original_size"],
+        "compressed_size": stats["compressed_size"]
+    }).encode('ascii')
+    stats["final_size"] = len(body)
+    return body
+
+async def _stream_encoded_payload(payload: dict, stats: dict):
+    """Тело callback'а в формате gzip/zstd: сжатый JSON как есть, с заголовком Content-Encoding"""
+    if CALLBACK_ENCODING == "zstd":
+        compressor = _zstd_compressor.compressobj()
+    else:
+        compressor = _gzip_compressor()
+    compressed_size = 0
+    async for compressed in _aiter_compressed_chunks(payload, stats, compressor):
+        compressed_size += len(compressed)
+        yield bytes(compressed)
+    stats["compressed_size"] = compressed_size
+    stats["final_size"] = compressed_size
+
+# HTTP-коды, при которых имеет смысл повторить отправку. Остальные 4xx (400, 404, 413...) -
+# постоянные ошибки, повтор не поможет
+CALLBACK_RETRYABLE_STATUSES = frozenset({408, 429, 502, 503, 504})
+CALLBACK_MAX_RETRY_AFTER = 60  # Верхняя граница ожидания по заголовку Retry-After, секунд
+# Общий лимит времени на отправку callback'а со всеми повторами: новая попытка не начинается,
+# если ожидание перед ней выходит за этот лимит (воркер не висит на недоступном получателе)
+CALLBACK_DEADLINE = 120
+CALLBACK_ATTEMPT_TIMEOUT = 60  # Лимит на одну попытку (не больше остатка CALLBACK_DEADLINE)
+
+def _parse_retry_after(value) -> float:
+    """Retry-After в секундах (формат HTTP-date не поддерживается - тогда обычный backoff)"""
+    try:
+        return min(max(float(value), 0.0), CALLBACK_MAX_RETRY_AFTER)
+    except (TypeError, ValueError):
+        return None
+
+async def send_callback(callback_url: str, payload: dict):
+    """Send callback with compression support.
+    gzip-base64 - тело собирается один раз в callback_executor и отправляется с Content-Length,
+    gzip/zstd - тело сжимается и отправляется потоково (chunked)"""
     
-    compression_ratio = (1 - final_size / original_size) * 100
+    project_name = payload.get("ProjectName", "unknown")
+    results_count = len(payload.get("Results", []))
     
-    logger.info(f"📤 Отправляем callback для {project_name}")
-    logger.info(f"   URL: {callback_url}")
-    logger.info(f"   Оригинал: {original_size / 1024:.2f} KB")
-    logger.info(f"   Сжато: {final_size / 1024:.2f} KB")
-    logger.info(f"   Экономия: {compression_ratio:.1f}%")
-    logger.info(f"   Результатов: {results_count}")
+    # На уровне INFO - только начало и итог отправки; подробности попыток - на DEBUG
+    logger.info("📤 Отправляем callback для %s (%s, результатов: %d)", project_name, callback_url, results_count)
     
     max_retries = 3
+    stats = {}
+    body = None
+    
+    attempts = 0
+    deadline = time.time() + CALLBACK_DEADLINE
     
     for attempt in range(max_retries):
         start_time = time.time()
-        logger.info(f"🔄 Попытка {attempt + 1}/{max_retries}")
+        remaining = deadline - start_time
+        if remaining <= 0:
+            logger.error(f"⌛ Превышен общий лимит {CALLBACK_DEADLINE}с на отправку callback'а - повторы прекращены")
+            break
+        attempts = attempt + 1
+        retry_after = None
+        logger.debug("🔄 Попытка %d/%d", attempt + 1, max_retries)
         
         try:
-            timeout = aiohttp.ClientTimeout(
-                total=60,
-                connect=10,
-                sock_read=30
-            )
-            
             headers = {
                 'Content-Type': 'application/json; charset=utf-8',
-                'User-Agent': 'SecretsScanner-Service/1.0',
-                'X-Compressed': 'gzip-base64'  # Указываем, что данные сжаты
+                'User-Agent': 'SecretsScanner-Service/1.0'
             }
+            if CALLBACK_ENCODING in ("gzip", "zstd"):
+                headers['Content-Encoding'] = CALLBACK_ENCODING
+                # Генератор создаётся заново на каждую попытку - тело отправляется chunked
+                stats = {}
+                data = _stream_encoded_payload(payload, stats)
+            else:
+                headers['X-Compressed'] = 'gzip-base64'  # Указываем, что данные сжаты
+                if body is None:
+                    body = await asyncio.get_running_loop().run_in_executor(
+                        callback_executor, _build_compressed_payload, payload, stats)
+                data = body
+            
+            session = await get_session()
+            logger.debug("🔗 Отправляем запрос на %s", callback_url)
             
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                logger.info(f"🔗 Устанавливаем соединение с {callback_url}")
+            # Попытка не может выйти за общий лимит: total урезается до остатка времени
+            timeout = aiohttp.ClientTimeout(
+                total=min(CALLBACK_ATTEMPT_TIMEOUT, remaining),
+                connect=10,
+                sock_read=30
+            )
+            async with session.post(
+                callback_url,
+                data=data,
+                headers=headers,
+                timeout=timeout
+            ) as response:
                 
-                async with session.post(
-                    callback_url,
-                    data=compressed_json,
-                    headers=headers
-                ) as response:
-                    
-                    elapsed = time.time() - start_time
-                    logger.info(f"📨 Получен ответ за {elapsed:.2f}с")
-                    logger.info(f"   Статус: {response.status} {response.reason}")
+                elapsed = time.time() - start_time
+                logger.debug("📨 Получен ответ за %.2fс: %s %s", elapsed, response.status, response.reason)
+                
+                if "original_size" in stats:
+                    compression_ratio = (1 - stats["final_size"] / stats["original_size"]) * 100 if stats["original_size"] else 0.0
+                    logger.debug("   Оригинал: %.2f KB, сжато: %.2f KB", stats["original_size"] / 1024, stats["final_size"] / 1024)
+                else:
+                    compression_ratio = 0.0
+                
+                try:
+                    response_text = await response.text()
+                    if response_text and logger.isEnabledFor(logging.DEBUG):
+                        preview = response_text[:200].replace('\n', '\\n')
+                        logger.debug("   Ответ (%d bytes): %s...", len(response_text), preview)
                     
-                    try:
-                        response_text = await response.text()
-                        response_size = len(response_text)
-                        logger.info(f"   Размер ответа: {response_size} bytes")
-                        
-                        if response_size > 0:
-                            preview = response_text[:200].replace('\n', '\\n')
-                            logger.info(f"   Начало ответа: {preview}...")
-                        
-                    except Exception as read_error:
-                        logger.error(f"❌ Ошибка чтения тела ответа: {read_error}")
-                        response_text = f"ERROR_READING_RESPONSE: {read_error}"
+                except Exception as read_error:
+                    logger.error(f"❌ Ошибка чтения тела ответа: {read_error}")
+                    response_text = f"ERROR_READING_RESPONSE: {read_error}"
+                
+                if response.status == 200:
+                    logger.info("✅ Callback для %s отправлен за %.2fс (%.2f KB, экономия %.1f%%)",
+                                project_name, elapsed, stats.get("final_size", 0) / 1024, compression_ratio)
+                    return
+                else:
+                    logger.error(f"❌ HTTP ошибка {response.status}: {response.reason}")
                     
-                    if response.status == 200:
-                        logger.info(f"✅ Callback успешно отправлен за {elapsed:.2f}с (экономия {compression_ratio:.1f}%)")
-                        return
+                    if response.status == 413:
+                        logger.error("💡 Ошибка 413: Payload слишком большой для сервера")
+                    elif response.status == 500:
+                        logger.error("💡 Ошибка 500: Внутренняя ошибка сервера при обработке")
+                    elif response.status == 502:
+                        logger.error("💡 Ошибка 502: Плохой шлюз (проблема с прокси)")
+                    elif response.status == 503:
+                        logger.error("💡 Ошибка 503: Сервис недоступен")
+                    elif response.status == 504:
+                        logger.error("💡 Ошибка 504: Таймаут шлюза")
                     else:
-                        logger.error(f"❌ HTTP ошибка {response.status}: {response.reason}")
-                        
-                        if response.status == 413:
-                            logger.error("💡 Ошибка 413: Payload слишком большой для сервера")
-                        elif response.status == 500:
-                            logger.error("💡 Ошибка 500: Внутренняя ошибка сервера при обработке")
-                        elif response.status == 502:
-                            logger.error("💡 Ошибка 502: Плохой шлюз (проблема с прокси)")
-                        elif response.status == 503:
-                            logger.error("💡 Ошибка 503: Сервис недоступен")
-                        elif response.status == 504:
-                            logger.error("💡 Ошибка 504: Таймаут шлюза")
-                        else:
-                            logger.error(f"💡 Неожиданный HTTP код: {response.status}")
-                        
-                        logger.error(f"   Полный ответ сервера: {response_text}")
-        
+                        logger.error(f"💡 Неожиданный HTTP код: {response.status}")
+                    
+                    logger.error(f"   Полный ответ сервера: {response_text}")
+                    
+                    if response.status < 500 and response.status not in CALLBACK_RETRYABLE_STATUSES:
+                        logger.error(f"   Код {response.status} не предполагает повтора - отправка прекращена")
+                        break
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+    
         except asyncio.TimeoutError as e:
             elapsed = time.time() - start_time
             logger.error(f"⏰ Таймаут после {elapsed:.2f}с на попытке {attempt + 1}")
@@ -522,28 +901,29 @@ async def send_callback(callback_url: str, payload: dict):
             elapsed = time.time() - start_time
             logger.error(f"🔌 Сервер разорвал соединение после {elapsed:.2f}с: {e}")
             
-        except json.JSONEncodeError as e:
+        except (TypeError, ValueError) as e:
             elapsed = time.time() - start_time
             logger.error(f"📝 Ошибка кодирования JSON: {e}")
             break
             
         except Exception as e:
             elapsed = time.time() - start_time
-            logger.error(f"❓ Неожиданная ошибка после {elapsed:.2f}с: {type(e).__name__}: {e}")
-            error_traceback = traceback.format_exc()
-            for line in error_traceback.split('\n'):
-                if line.strip():
-                    logger.error(f"      {line}")
+            logger.exception(f"❓ Неожиданная ошибка после {elapsed:.2f}с: {type(e).__name__}: {e}")
         
         if attempt < max_retries - 1:
-            wait_time = 2 ** attempt
-            logger.info(f"⏳ Ждем {wait_time}с перед следующей попыткой...")
+            # Случайная добавка разводит повторы нескольких callback'ов к одному получателю
+            wait_time = retry_after if retry_after is not None else 2 ** attempt + random.random()
+            if time.time() + wait_time >= deadline:
+                logger.error(f"⌛ Превышен общий лимит {CALLBACK_DEADLINE}с на отправку callback'а - повторы прекращены")
+                break
+            logger.info(f"⏳ Ждем {wait_time:.1f}с перед следующей попыткой...")
             await asyncio.sleep(wait_time)
     
-    logger.error(f"💥 КРИТИЧНО: Не удалось отправить callback после {max_retries} попыток")
+    logger.error(f"💥 КРИТИЧНО: Не удалось отправить callback после {attempts} попыток")
     logger.error(f"   Проект: {project_name}")
     logger.error(f"   URL: {callback_url}")
-    logger.error(f"   Размер (сжатый): {final_size / 1024:.2f} KB")
+    if "final_size" in stats:
+        logger.error(f"   Размер (сжатый): {stats['final_size'] / 1024:.2f} KB")
 
 async def send_error_callback(callback_url: str, error_message: str):
     """Send error callback"""
@@ -553,15 +933,79 @@ async def send_error_callback(callback_url: str, error_message: str):
     }
     await send_callback(callback_url, payload)
 
+async def send_batched_callback(callback_url: str, payloads: list):
+    """Send results of several multi-scan projects in one callback (поле Batch - список обычных payload'ов)"""
+    payload = {
+        "Status": "completed",
+        "Message": "Batch",
+        "ProjectName": f"batch ({len(payloads)})",
+        "Batch": payloads
+    }
+    await send_callback(callback_url, payload)
+    logger.info(f"Пакетный callback отправлен: {len(payloads)} проектов")
+
+# Обработчики задач очереди по TaskKind (см. start_worker)
+TASK_HANDLERS = {
+    TaskKind.SINGLE: process_request_async,
+    TaskKind.MULTI: process_multi_scan_sequence,
+    TaskKind.LOCAL: process_local_scan_async,
+}
+
 # Cleanup function for graceful shutdown
 async def cleanup_executors():
-    """Cleanup executors on shutdown"""
+    """Cleanup executors on shutdown.
+    Блокирующие ожидания вынесены в потоки, чтобы timeout в lifespan срабатывал"""
+    global _shutting_down
+    _shutting_down = True
+    for task in list(active_tasks):
+        task.cancel()
+
+    try:
+        if _session is not None and not _session.closed:
+            logger.info("Закрытие HTTP-сессии...")
+            await _session.close()
+    except Exception as e:
+        logger.error(f"Ошибка при закрытии HTTP-сессии: {e}")
+
     try:
         logger.info("Очистка thread pool...")
-        download_executor.shutdown(wait=True, cancel_futures=True)
+        download_executor.shutdown(wait=False, cancel_futures=True)
     except Exception as e:
         logger.error(f"Ошибка при остановке download_executor: {e}")
     
+    try:
+        cleanup_executor.shutdown(wait=False, cancel_futures=True)
+    except Exception as e:
+        logger.error(f"Ошибка при остановке cleanup_executor: {e}")
+    
+    try:
+        callback_executor.shutdown(wait=False, cancel_futures=True)
+    except Exception as e:
+        logger.error(f"Ошибка при остановке callback_executor: {e}")
+    
+    try:
+        small_scan_executor.shutdown(wait=False, cancel_futures=True)
+    except Exception as e:
+        logger.error(f"Ошибка при остановке small_scan_executor: {e}")
+    
+    try:
+        extract_executor.shutdown(wait=False, cancel_futures=True)
+    except Exception as e:
+        logger.error(f"Ошибка при остановке extract_executor: {e}")
+    
+    try:
+        # Директории в TEMP_DIR (по умолчанию /dev/shm - это RAM) удаляются все, включая
+        # выданные запросам: их release_workdir отменён вместе с active_tasks
+        await asyncio.to_thread(_delete_workdirs)
+    except Exception as e:
+        logger.error(f"Ошибка при удалении рабочих директорий: {e}")
+    
+    try:
+        if extract_process_executor is not None:
+            extract_process_executor.shutdown(wait=False, cancel_futures=True)
+    except Exception as e:
+        logger.error(f"Ошибка при остановке extract_process_executor: {e}")
+    
     try:
         logger.info("Очистка process pool...")
         # Для Windows - принудительное завершение процессов
@@ -573,4 +1017,5 @@ async def cleanup_executors():
     except Exception as e:
         logger.error(f"Ошибка при остановке model_executor: {e}")
     
-    logger.info("Cleanup завершен")
\ No newline at end of file
+    logger.info("Cleanup завершен")
+    stop_queue_logging()
\ No newline at end of file
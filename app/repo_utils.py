@@ -1,21 +1,32 @@
 import os
 import zipfile
+import io
 import tempfile
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from requests_ntlm import HttpNtlmAuth
 # from requests_negotiate_sspi import HttpNegotiateAuth
 from urllib.parse import urlparse
-import io
 import shutil
+import struct
+import subprocess
 import yaml
 from dotenv import load_dotenv
 from app.secure_save import decrypt_from_file
 import urllib3
 import time
+import threading
 import asyncio
 import base64
 import logging
+import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
 from logging.handlers import RotatingFileHandler
 
 # Load environment variables
@@ -31,53 +42,110 @@ logging.basicConfig(
 )
 logger = logging.getLogger("repo_utils")
 
-with open('Settings/excluded_files.yml', 'r') as f:
-    data = yaml.safe_load(f)
-
-# Преобразуем список в множество
-EXCLUDED_FILES = set(data.get('excluded_files', []))
+# C-загрузчик libyaml, если PyYAML собран с ним (в разы быстрее чистого Python), иначе обычный SafeLoader
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 with open('Settings/excluded_extensions.yml', 'r') as f:
-    data = yaml.safe_load(f)
+    data = yaml.load(f, Loader=YamlLoader)
 
-# Преобразуем список в множество
+# Исключенные расширения не выкачиваются при частичном клоне (sparse-checkout в режиме git)
 EXCLUDED_EXTENSIONS = set(data.get('excluded_extensions', []))
 
 # Disable SSL warnings
 urllib3.disable_warnings()
 
-# Load environment variables
-load_dotenv()
-
 HubType = os.getenv("HubType")
 MAX_PATH = 250
-
-# Аутентификация
-try:
-    TOKEN_FILE = "Settings/pat_token.dat"
-    LOGIN_FILE = "Settings/login.dat"
-    PASSWORD_FILE = "Settings/password.dat"
-    pat = decrypt_from_file(TOKEN_FILE, key_name="PAT_KEY")
-    username = decrypt_from_file(LOGIN_FILE, key_name="LOGIN_KEY")
-    password = decrypt_from_file(PASSWORD_FILE, key_name="PASSWORD_KEY")
-except Exception as error:
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB - порция при потоковом скачивании архива
+
+# Способ скачивания из Azure DevOps: zip (архив коммита через REST API, по умолчанию) или
+# git (частичный клон без файлов с исключенными расширениями - меньше трафика, нужен git и PAT).
+# В режиме git файлы с исключенными расширениями не попадают на диск и не учитываются в AllFiles/SkippedFiles
+AZURE_DOWNLOAD_MODE = os.getenv("AZURE_DOWNLOAD_MODE", "zip").lower()
+GIT_TIMEOUT = 600  # секунд на каждую команду git
+
+# Единственный пул распаковки архивов (скачанных репозиториев и загруженных ZIP): zlib отпускает GIL,
+# поэтому записи архива распаковываются параллельно. Останавливается в queue_worker.cleanup_executors
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(8, os.cpu_count() or 1))))
+extract_executor = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="extract")
+# Буфер копирования - один на поток (или процесс) распаковки, переиспользуется для всех записей архива
+_extract_buffers = threading.local()
+
+def _get_extract_buffer() -> memoryview:
+    buffer = getattr(_extract_buffers, "buffer", None)
+    if buffer is None:
+        buffer = _extract_buffers.buffer = memoryview(bytearray(DOWNLOAD_CHUNK_SIZE))
+    return buffer
+
+# Аутентификация. Данные расшифровываются при первом обращении, а не при импорте модуля -
+# процессы, которые не ходят в Azure DevOps (например, процессы сканирования), их не расшифровывают
+TOKEN_FILE = "Settings/pat_token.dat"
+LOGIN_FILE = "Settings/login.dat"
+PASSWORD_FILE = "Settings/password.dat"
+
+def _log_auth_error(error):
     logger.error(f"Error: {str(error)}")
     logger.error("Если это первый запуск - необходимо запустить мастер настройки Auth данных `python app/secure_save.py`")
 
+@lru_cache(maxsize=1)
+def _get_pat():
+    """PAT токен или None, если не настроен"""
+    try:
+        return decrypt_from_file(TOKEN_FILE, key_name="PAT_KEY")
+    except Exception as error:
+        _log_auth_error(error)
+        return None
+
+@lru_cache(maxsize=1)
+def _get_ntlm_credentials():
+    """(логин, пароль) для NTLM Auth или (None, None), если не настроены"""
+    try:
+        return decrypt_from_file(LOGIN_FILE, key_name="LOGIN_KEY"), decrypt_from_file(PASSWORD_FILE, key_name="PASSWORD_KEY")
+    except Exception as error:
+        _log_auth_error(error)
+        return None, None
+
 auth_methods = ["basic", "pat"]  # 'pat', 'basic', 'Negotiate' или None
 
 
 def get_auth(auth_method):
-    if auth_method == 'pat' and pat:
-        return HTTPBasicAuth("", pat)
-    elif auth_method == 'basic' and username and password:
-        return HttpNtlmAuth(username, password)
+    if auth_method == 'pat':
+        pat = _get_pat()
+        if pat:
+            return HTTPBasicAuth("", pat)
+    elif auth_method == 'basic':
+        username, password = _get_ntlm_credentials()
+        if username and password:
+            return HttpNtlmAuth(username, password)
     # elif auth_method == 'Negotiate':
     #     return HttpNegotiateAuth()
-    else:
-        return None
-
-
+    return None
+
+
+# Сессии Azure DevOps - по одной на метод аутентификации. Соединения (TLS + NTLM-рукопожатие)
+# переиспользуются между запросами, а не открываются заново на каждый requests.get
+_AZURE_SESSIONS = {}
+_azure_sessions_lock = threading.Lock()
+
+def _session_for(auth_method):
+    """Общая requests.Session для метода аутентификации (создаётся при первом обращении)"""
+    session = _AZURE_SESSIONS.get(auth_method)
+    if session is None:
+        with _azure_sessions_lock:
+            session = _AZURE_SESSIONS.get(auth_method)
+            if session is None:
+                session = requests.Session()
+                session.auth = get_auth(auth_method)
+                session.verify = False
+                adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _AZURE_SESSIONS[auth_method] = session
+    return session
+
+# Один и тот же URL разбирается при проверке ref и при скачивании - результат кешируется
+# (для некорректных URL исключение поднимается каждый раз, lru_cache его не запоминает)
+@lru_cache(maxsize=512)
 def parse_azure_devops_url(repo_url):
     parsed = urlparse(repo_url)
     server = parsed.netloc
@@ -104,64 +172,167 @@ def parse_azure_devops_url(repo_url):
     return server, collection, project, repository
 
 async def download_repo(repo_url, commit_id, extract_path):
-    extracted_path = ""
+    """(путь к распакованному репозиторию или "", статус, число распакованных файлов или None, если неизвестно)"""
+    extracted_path, status, file_count = "", f"Неизвестный HubType: {HubType}", None
     if HubType.lower() == "azure":
-        extracted_path, status = await download_repo_azure(repo_url, commit_id, extract_path)
+        extracted_path, status, file_count = await download_repo_azure(repo_url, commit_id, extract_path)
     elif HubType.lower() == "github":
-        extracted_path, status = await download_github_repo(repo_url, commit_id, extract_path)
-    return extracted_path, status
+        extracted_path, status, file_count = await download_github_repo(repo_url, commit_id, extract_path)
+    return extracted_path, status, file_count
+
+async def download_repo_azure(repo_url, commit_id, extract_path):
+    """Скачивание выполняется блокирующим requests, поэтому уводим его в пул потоков event loop'а"""
+    loop = asyncio.get_running_loop()
+    if AZURE_DOWNLOAD_MODE == "git":
+        return await loop.run_in_executor(None, _download_azure_git_sync, repo_url, commit_id, extract_path)
+    return await loop.run_in_executor(None, _download_repo_azure_sync, repo_url, commit_id, extract_path)
+
+async def download_github_repo(repo_url, commit_id, extract_path):
+    """Скачивание выполняется блокирующим requests, поэтому уводим его в пул потоков event loop'а"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _download_github_repo_sync, repo_url, commit_id, extract_path)
+
+def _member_path(member, extract_path):
+    """Путь для записи архива или None, если запись нужно пропустить"""
+    filename = member.filename
+
+    # Игнорируем абсолютные пути и ".." (как компонент пути - имена вида "a..b" допустимы)
+    parts = filename.replace("\\", "/").split("/")
+    if os.path.isabs(filename) or filename.startswith(("/", "\\")) or ".." in parts:
+        logger.warning(f"Пропущен небезопасный путь в архиве: {filename}")
+        return None
+
+    return _truncate_path(os.path.join(extract_path, *[part for part in parts if part]))
+
+def _truncate_path(full_path):
+    # Если слишком длинный — обрезаем путь
+    if len(full_path) > MAX_PATH:
+        base, name = os.path.split(full_path)
+        name = name[:100]  # Обрезаем имя файла
+        full_path = os.path.join(base, name)
+    return full_path
 
-def safe_extract(zip_file, extract_path):
+# Большие файлы резервируются на диске целиком до записи (меньше обновлений метаданных ФС и фрагментации)
+PREALLOCATE_MIN_SIZE = DOWNLOAD_CHUNK_SIZE
+
+def _preallocate(target, size):
+    """Зарезервировать место под файл. Не везде поддерживается (Windows, часть ФС) - тогда просто пишем как есть"""
+    if not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(target.fileno(), 0, size)
+    except OSError:
+        pass
+
+def _copy_stored(zip_file, member, target):
+    """Запись без сжатия (STORED) копируется из архива в файл внутри ядра через copy_file_range.
+    False - способ недоступен (не Linux, шифрование, ФС не поддерживает), нужно копировать обычным способом"""
+    if not hasattr(os, "copy_file_range") or member.compress_type != zipfile.ZIP_STORED or member.flag_bits & 0x1:
+        return False
+    try:
+        src_fd = zip_file.fp.fileno()
+        # Данные начинаются после локального заголовка: 30 байт + имя + extra (длины - в конце заголовка)
+        header = os.pread(src_fd, 30, member.header_offset)
+        if header[:4] != b"PK\x03\x04":
+            return False
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        offset = member.header_offset + 30 + name_length + extra_length
+
+        dst_fd = target.fileno()
+        copied = 0
+        while copied < member.file_size:
+            count = os.copy_file_range(src_fd, dst_fd, member.file_size - copied, offset + copied, copied)
+            if count == 0:
+                raise OSError("архив закончился раньше записи")
+            copied += count
+        return True
+    except OSError:
+        target.seek(0)
+        target.truncate()
+        return False
+
+def _write_member(zip_file, member, full_path):
+    """Запись одного файла архива (директории уже созданы в safe_extract)"""
+    with zip_file.open(member) as source, open(full_path, "wb") as target:
+        if member.file_size >= PREALLOCATE_MIN_SIZE:
+            _preallocate(target, member.file_size)
+        if member.file_size and _copy_stored(zip_file, member, target):
+            return
+        buffer = _get_extract_buffer()
+        while True:
+            n = source.readinto(buffer)
+            if not n:
+                break
+            target.write(buffer[:n])
+
+def _open_archive(source):
+    """ZipFile по пути к архиву или поверх bytes (BytesIO не копирует буфер)"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return zipfile.ZipFile(io.BytesIO(source))
+    return zipfile.ZipFile(source)
+
+def _extract_group(source, group):
+    """Распаковка части записей. ZipFile не потокобезопасен - у каждого потока (процесса) свой объект"""
+    with _open_archive(source) as zip_file:
+        for member, full_path in group:
+            _write_member(zip_file, member, full_path)
+
+def _split_members(members, parts):
+    """Разбить записи [(ZipInfo, путь)] на parts групп с примерно одинаковым суммарным размером.
+    Внутри группы записи идут в порядке header_offset - архив читается последовательно"""
+    groups = [[] for _ in range(parts)]
+    sizes = [0] * parts
+    for item in sorted(members, key=lambda item: item[0].file_size, reverse=True):
+        idx = sizes.index(min(sizes))
+        groups[idx].append(item)
+        sizes[idx] += item[0].file_size
+    for group in groups:
+        group.sort(key=lambda item: item[0].header_offset)
+    return [group for group in groups if group]
+
+def safe_extract(zip_file, extract_path, source=None, executor=None, parts=None):
     """
-    Безопасная распаковка ZIP архива с фильтрацией нежелательных файлов
-    
+    Безопасная распаковка ZIP архива (небезопасные пути пропускаются).
+    Исключенные файлы и расширения распаковываются: сканер сам учитывает их
+    в SkippedFiles/AllFiles, а определение фреймворков читает, например, requirements.txt.
+    Список записей фильтруется один раз, директории создаются заранее,
+    а сами файлы распаковываются параллельно (по умолчанию в extract_executor)
+
     Args:
-        zip_file: ZipFile объект
+        zip_file: открытый ZipFile
         extract_path: путь для распаковки
-        excluded_extensions: список исключенных расширений (например, ['.exe', '.bat'])
-        excluded_files: список исключенных имен файлов (например, ['autorun.inf', 'desktop.ini'])
+        source: откуда каждый поток открывает свой ZipFile - путь или bytes (по умолчанию zip_file.filename)
+        executor, parts: пул и число групп (например, пул процессов для больших архивов - тогда source должен быть путём)
+
+    Returns:
+        количество распакованных файлов
     """
-    
+    members = []
     for member in zip_file.infolist():
-        filename = member.filename
-
-        # Игнорируем абсолютные пути и ".."
-        if os.path.isabs(filename) or ".." in filename:
+        if member.is_dir():
             continue
-        
-        # Получаем только имя файла без пути
-        basename = os.path.basename(filename).lower()
-        
-        # Проверяем исключенные файлы
-        if basename in EXCLUDED_FILES:
-            continue
-        
-        # Проверяем исключенные расширения
-        file_ext = os.path.splitext(basename)[1]
-        if file_ext in EXCLUDED_EXTENSIONS:
-            continue
-
-        full_path = os.path.join(extract_path, filename)
+        full_path = _member_path(member, extract_path)
+        if full_path is not None:
+            members.append((member, full_path))
 
-        # Если слишком длинный — обрезаем путь
-        if len(full_path) > MAX_PATH:
-            base, name = os.path.split(full_path)
-            name = name[:100]  # Обрезаем имя файла
-            full_path = os.path.join(base, name)
+    for directory in {os.path.dirname(full_path) for _, full_path in members}:
+        os.makedirs(directory, exist_ok=True)
 
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    source = zip_file.filename if source is None else source
+    executor = extract_executor if executor is None else executor
+    futures = [executor.submit(_extract_group, source, group) for group in _split_members(members, parts or EXTRACT_WORKERS)]
+    for future in futures:
+        future.result()
+    return len(members)
 
-        with zip_file.open(member) as source, open(full_path, "wb") as target:
-            target.write(source.read())
-
-async def download_repo_azure(repo_url, commit_id, extract_path):
+def _download_repo_azure_sync(repo_url, commit_id, extract_path):
     os.makedirs(extract_path, exist_ok=True)
 
     try:
         server, collection, project, repo_name = parse_azure_devops_url(repo_url)
     except ValueError as e:
         logger.error(f"Ошибка парсинга URL '{repo_url}': {e}")
-        return False
+        return "", f"Ошибка парсинга URL '{repo_url}': {e}", None
 
     base_url = f"https://{server}/{collection}"
     api_url = f"{base_url}/{project}/_apis/git/repositories/{repo_name}/items"
@@ -175,6 +346,8 @@ async def download_repo_azure(repo_url, commit_id, extract_path):
         "api-version": "5.1-preview.1"
     }
 
+    pat = _get_pat() if 'pat' in auth_methods else None
+
     for auth_method in auth_methods:
         download_start = time.time()
         logger.info(f"Скачиваем '{repo_name}' --> {commit_id[:7]}... auth_method: {auth_method}")
@@ -189,36 +362,95 @@ async def download_repo_azure(repo_url, commit_id, extract_path):
             headers = {
                 'Authorization': f'Basic {token_b64}'
             }
-            response = requests.get(pat_api_url, params=params, headers=headers, stream=True, verify=False)
+            response = _session_for(auth_method).get(pat_api_url, params=params, headers=headers, stream=True)
         else:
             # Для других методов аутентификации используем обычный подход
-            auth = get_auth(auth_method)
-            response = requests.get(api_url, params=params, auth=auth, stream=True, verify=False)
-
-        if response.status_code == 200:
-            try:
-                with tempfile.NamedTemporaryFile(suffix=".zip", delete=False) as temp_file:
-                    temp_zip_path = temp_file.name
-                    temp_file.write(response.content)
-
-                with zipfile.ZipFile(temp_zip_path) as zip_file:
-                    zip_file.extractall(extract_path)
-                    # safe_extract(zip_file, extract_path)
-                download_time = time.time() - download_start
-                logger.info(f"Репозиторий успешно распакован в: {extract_path} (время: {download_time:.2f}с)")
+            response = _session_for(auth_method).get(api_url, params=params, stream=True)
+
+        if response.status_code != 200:
+            # Тело ошибки не читаем - соединение возвращается в пул, пробуем следующий метод
+            response.close()
+            continue
+
+        temp_zip_path = None
+        try:
+            # Архив пишется на диск порциями по мере скачивания (рядом с папкой распаковки, на томе TEMP_DIR)
+            with response, tempfile.NamedTemporaryFile(suffix=".zip", dir=os.path.dirname(os.path.abspath(extract_path)), delete=False) as temp_file:
+                temp_zip_path = temp_file.name
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if chunk:
+                        temp_file.write(chunk)
+
+            with zipfile.ZipFile(temp_zip_path) as zip_file:
+                file_count = safe_extract(zip_file, extract_path)
+            download_time = time.time() - download_start
+            logger.info(f"Репозиторий успешно распакован в: {extract_path} (время: {download_time:.2f}с)")
+            return extract_path, "Success", file_count
+        
+        except Exception as e:
+            logger.error(f"Ошибка при распаковке архива: {e}")
+            return_string = f"Ошибка при распаковке архива: {e}"
+            return "", return_string, None
+        finally:
+            if temp_zip_path:
                 os.unlink(temp_zip_path)
-                return extract_path, "Success"
-            
-            except Exception as e:
-                logger.error(f"Ошибка при распаковке архива: {e}")
-                return_string = f"Ошибка при распаковке архива: {e}"
-                return "", return_string
             
     logger.error(f"Ошибка при скачивании {repo_name}: {response.status_code}")
     return_string = f"Ошибка при скачивании {repo_name}: {response.status_code}"
-    return "", return_string
+    return "", return_string, None
 
-async def download_github_repo(repo_url, commit_id, extract_path):
+def _download_azure_git_sync(repo_url, commit_id, extract_path):
+    """
+    Частичный клон Azure DevOps репозитория на коммите: fetch --depth 1 --filter=blob:none и
+    sparse-checkout без исключенных расширений - содержимое исключенных файлов не скачивается.
+    Служебная папка .git создаётся отдельно от extract_path и удаляется. При любой ошибке
+    (нет git, нет PAT, сервер не отдаёт коммит) используется обычное скачивание zip-архива
+    """
+    git = shutil.which("git")
+    pat = _get_pat()
+    if not git or not pat:
+        logger.warning("Режим AZURE_DOWNLOAD_MODE=git недоступен (нет git или PAT) - скачиваем zip-архив")
+        return _download_repo_azure_sync(repo_url, commit_id, extract_path)
+
+    os.makedirs(extract_path, exist_ok=True)
+    download_start = time.time()
+    git_dir = tempfile.mkdtemp(prefix="git_", dir=os.path.dirname(os.path.abspath(extract_path)))
+    # Авторизация - заголовком через переменные окружения git: токен не попадает
+    # ни в URL, ни в конфиг репозитория, ни в командную строку процесса
+    token_b64 = base64.b64encode((':' + pat).encode('ascii')).decode('ascii')
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0", GIT_CONFIG_COUNT="1",
+               GIT_CONFIG_KEY_0="http.extraHeader", GIT_CONFIG_VALUE_0=f"Authorization: Basic {token_b64}")
+    base_cmd = [
+        git, f"--git-dir={git_dir}", f"--work-tree={extract_path}",
+        "-c", "http.sslVerify=false",
+        "-c", "core.longpaths=true",
+    ]
+    sparse_patterns = ["/*"] + [f"!*{ext}" for ext in sorted(EXCLUDED_EXTENSIONS)]
+
+    try:
+        logger.info(f"Частичный клон '{repo_url}' --> {commit_id[:7]}...")
+        for args in (
+            ["init", "--quiet"],
+            ["remote", "add", "origin", repo_url],
+            ["fetch", "--quiet", "--depth", "1", "--filter=blob:none", "origin", commit_id],
+            ["sparse-checkout", "set", "--no-cone", *sparse_patterns],
+            ["checkout", "--quiet", "--force", "FETCH_HEAD"],
+        ):
+            subprocess.run(base_cmd + args, check=True, timeout=GIT_TIMEOUT, env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+        download_time = time.time() - download_start
+        logger.info(f"Репозиторий получен частичным клоном в: {extract_path} (время: {download_time:.2f}с)")
+        # Число файлов при клоне не подсчитывается
+        return extract_path, "Success", None
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, OSError) as e:
+        stderr = getattr(e, "stderr", None) or b""
+        logger.warning(f"Частичный клон не удался ({e.__class__.__name__}: {stderr.decode(errors='replace').strip()[:300]}) - скачиваем zip-архив")
+        return _download_repo_azure_sync(repo_url, commit_id, extract_path)
+    finally:
+        delete_dir(git_dir)
+
+def _download_github_repo_sync(repo_url, commit_id, extract_path):
     """
     Скачивает архив репозитория GitHub на указанном коммите и распаковывает его.
 
@@ -237,29 +469,115 @@ async def download_github_repo(repo_url, commit_id, extract_path):
 
         logger.info(f"Скачиваем {zip_url}...")
 
-        # Скачиваем zip архив
-        response = requests.get(zip_url, verify=False)
-        response.raise_for_status()
-
-        # Распаковываем архив в указанную папку
-        with zipfile.ZipFile(io.BytesIO(response.content)) as zip_file:
-            zip_file.extractall(extract_path)
+        # Скачиваем zip архив потоково во временный файл рядом с папкой распаковки (тот же том TEMP_DIR),
+        # чтобы не держать весь архив в памяти
+        with tempfile.NamedTemporaryFile(suffix=".zip", dir=os.path.dirname(os.path.abspath(extract_path)), delete=False) as temp_file:
+            temp_zip_path = temp_file.name
+        try:
+            with requests.get(zip_url, verify=False, stream=True) as response:
+                response.raise_for_status()
+                with open(temp_zip_path, "wb") as temp_file:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        temp_file.write(chunk)
+
+            # Распаковываем архив в указанную папку
+            with zipfile.ZipFile(temp_zip_path) as zip_file:
+                file_count = safe_extract(zip_file, extract_path)
+        finally:
+            os.unlink(temp_zip_path)
 
         download_time = time.time() - download_start
         logger.info(f"Репозиторий успешно скачан и распакован в: {extract_path} (время: {download_time:.2f}с)")
-        return extract_path, "Success"
+        return extract_path, "Success", file_count
     except requests.HTTPError as http_err:
         logger.error(f"HTTP ошибка: {http_err}")
         return_string = f"HTTP ошибка: {http_err}"
-        return "", return_string
+        return "", return_string, None
     except Exception as err:
         logger.error(f"Общая ошибка: {err}")
         return_string = f"Общая ошибка: {err}"
-        return "", return_string
+        return "", return_string, None
+
+# Ответы refs API (список веток/тегов) бывают большими - разбираем orjson, если установлен
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# Метод аутентификации, последним успешно проверивший ref - с него начинается следующая проверка
+_preferred_auth_method = None
+
+def _resolve_azure_ref_sync(auth_method, repo_url, base_api_url, ref_type, ref):
+    """Резолв ref одним методом аутентификации (блокирующий requests, выполняется в пуле потоков).
+
+    Returns:
+        (True, (существует, хэш_коммита, сообщение)) - окончательный ответ,
+        (False, сообщение) - метод не подошёл (нет доступа/ошибка запроса)
+    """
+    session = _session_for(auth_method)
+    logger.info(f"Try to resolve {repo_url} --> {ref_type}. auth_method={auth_method}")
+
+    try:
+        if ref_type == "branch":
+            url = f"{base_api_url}/refs?filter=heads/{ref}&api-version=5.1-preview.1"
+            response = session.get(url, timeout=20)
+            if response.status_code not in [200, 201, 202, 203]:
+                if response.status_code in [401, 403]:
+                    return False, f"Access Denied: [{response.status_code}]. Проверьте, что у PAT-токена/NTLM Auth есть доступ к репозиторию."
+                return False, f"Запрос к репозиторию выдал {response.status_code} код. Возможно неверные креды или нет доступа к репозиторию"
+            data = _json_loads(response.content)
+            if data.get("count", 0) == 0:
+                return True, (False, None, "Ветка не найдена")
+            commit_hash = data["value"][0]["objectId"]
+            return True, (True, commit_hash, "")
+
+        elif ref_type == "tag":
+            # Сначала получаем objectId тега
+            url = f"{base_api_url}/refs?filter=tags/{ref}&api-version=5.1-preview.1"
+            response = session.get(url, timeout=20)
+            if response.status_code not in [200, 201, 202, 203]:
+                if response.status_code in [401, 403]:
+                    return False, f"Access Denied: [{response.status_code}]. Проверьте, что у PAT-токена/NTLM Auth есть доступ к репозиторию."
+                return False, f"Запрос к репозиторию выдал {response.status_code} код. Возможно неверные креды или нет доступа к репозиторию"
+            data = _json_loads(response.content)
+            if data.get("count", 0) == 0:
+                return True, (False, None, "Тег не найден")
+
+            tag_object_id = data["value"][0]["objectId"]
+
+            # Пробуем получить аннотированный тег
+            tag_url = f"{base_api_url}/annotatedtags/{tag_object_id}?api-version=6.1-preview"
+            tag_response = session.get(tag_url, timeout=20)
+
+            if tag_response.status_code == 200:
+                tag_data = _json_loads(tag_response.content)
+                tagged_object = tag_data.get("taggedObject", {})
+                if tagged_object.get("objectType") == "commit":
+                    return True, (True, tagged_object["objectId"], "")
+                else:
+                    return True, (True, tag_object_id, "Не commit-объект, но тег найден")
+            else:
+                # fallback если не удалось получить annotated tag
+                return True, (True, tag_object_id, "Не удалось получить аннотированный тег, возвращён objectId")
+
+        else:
+            url = f"{base_api_url}/commits/{ref}?api-version=5.1-preview.1"
+            response = session.get(url, timeout=20)
+            if response.status_code == 200:
+                data = _json_loads(response.content)
+                commit_id = data.get("commitId")
+                if commit_id:
+                    return True, (True, commit_id, "")
+                return True, (False, None, "Коммит не найден")
+            return False, ""
+
+    except Exception as e:
+        message = f"Ошибка при проверке Azure DevOps ссылки: {e}"
+        logger.error(f"{message}")
+        return False, message
 
 async def check_ref_and_resolve_azure(repo_url: str, ref_type: str, ref: str):
     """
     Проверка существования ветки, тега или коммита в Azure DevOps и получение commit hash.
+    Сначала пробуется метод, сработавший в прошлый раз; если он не подошёл, остальные
+    методы проверяются одновременно и ответ берётся от первого, получившего доступ.
 
     Args:
         repo_url: URL Azure DevOps репозитория
@@ -269,84 +587,49 @@ async def check_ref_and_resolve_azure(repo_url: str, ref_type: str, ref: str):
     Returns:
         (существует: bool, хэш_коммита: Optional[str], сообщение: str)
     """
-    message = ""
-
-    for auth_method in auth_methods:
-        auth = get_auth(auth_method)
-        logger.info(f"Try to resolve {repo_url} --> {ref_type}. auth_method={auth_method}")
-
-        try:
-            server, collection, project, repository = parse_azure_devops_url(repo_url)
-            base_api_url = f"https://{server}/{collection}/{project}/_apis/git/repositories/{repository}"
-
-            if ref_type.lower() == "branch":
-                url = f"{base_api_url}/refs?filter=heads/{ref}&api-version=5.1-preview.1"
-                response = requests.get(url, auth=auth, verify=False, timeout=20)
-                if response.status_code not in [200, 201, 202, 203]:
-                    if response.status_code in [401, 403]:
-                        message = f"Access Denied: [{response.status_code}]. Проверьте, что у PAT-токена/NTLM Auth есть доступ к репозиторию."
-                    else:
-                        message = f"Запрос к репозиторию выдал {response.status_code} код. Возможно неверные креды или нет доступа к репозиторию"
-                    continue
-                message = ""
-                data = response.json()
-                if data.get("count", 0) == 0:
-                    return False, None, "Ветка не найдена"
-                commit_hash = data["value"][0]["objectId"]
-                return True, commit_hash, ""
-
-            elif ref_type.lower() == "tag":
-                # Сначала получаем objectId тега
-                url = f"{base_api_url}/refs?filter=tags/{ref}&api-version=5.1-preview.1"
-                response = requests.get(url, auth=auth, verify=False, timeout=20)
-                if response.status_code not in [200, 201, 202, 203]:
-                    if response.status_code in [401, 403]:
-                        message = f"Access Denied: [{response.status_code}]. Проверьте, что у PAT-токена/NTLM Auth есть доступ к репозиторию."
-                    else:
-                        message = f"Запрос к репозиторию выдал {response.status_code} код. Возможно неверные креды или нет доступа к репозиторию"
-                    continue
-                message = ""
-                data = response.json()
-                if data.get("count", 0) == 0:
-                    return False, None, "Тег не найден"
-
-                tag_object_id = data["value"][0]["objectId"]
-
-                # Пробуем получить аннотированный тег
-                tag_url = f"{base_api_url}/annotatedtags/{tag_object_id}?api-version=6.1-preview"
-                tag_response = requests.get(tag_url, auth=auth, verify=False, timeout=20)
-
-                if tag_response.status_code == 200:
-                    tag_data = tag_response.json()
-                    tagged_object = tag_data.get("taggedObject", {})
-                    if tagged_object.get("objectType") == "commit":
-                        return True, tagged_object["objectId"], ""
-                    else:
-                        return True, tag_object_id, "Не commit-объект, но тег найден"
-                else:
-                    # fallback если не удалось получить annotated tag
-                    return True, tag_object_id, "Не удалось получить аннотированный тег, возвращён objectId"
-
-            elif ref_type.lower() == "commit":
-                url = f"{base_api_url}/commits/{ref}?api-version=5.1-preview.1"
-                response = requests.get(url, auth=auth, verify=False, timeout=20)
-                if response.status_code == 200:
-                    data = response.json()
-                    commit_id = data.get("commitId")
-                    if commit_id:
-                        return True, commit_id, ""
-                    return False, None, "Коммит не найден"
-                else:
-                    message = ""
-                    continue
-            else:
-                return False, None, f"❌ Неверный тип ref: {ref_type}"
-
-        except Exception as e:
-            message = f"Ошибка при проверке Azure DevOps ссылки: {e}"
-            logger.error(f"{message}")
-            return False, None, message
-
+    # URL разбирается один раз, а не на каждый метод аутентификации
+    try:
+        server, collection, project, repository = parse_azure_devops_url(repo_url)
+    except ValueError as e:
+        message = f"Ошибка при проверке Azure DevOps ссылки: {e}"
+        logger.error(f"{message}")
+        return False, None, message
+    base_api_url = f"https://{server}/{collection}/{project}/_apis/git/repositories/{repository}"
+
+    if ref_type.lower() not in ("branch", "tag", "commit"):
+        return False, None, f"❌ Неверный тип ref: {ref_type}"
+
+    global _preferred_auth_method
+    loop = asyncio.get_running_loop()
+    messages = {}
+
+    # Сначала - метод, сработавший в прошлый раз: в обычном случае это один запрос
+    preferred = _preferred_auth_method if _preferred_auth_method in auth_methods else (auth_methods[0] if auth_methods else None)
+    if preferred is not None:
+        is_final, result = await loop.run_in_executor(None, _resolve_azure_ref_sync, preferred, repo_url, base_api_url, ref_type.lower(), ref)
+        if is_final:
+            _preferred_auth_method = preferred
+            return result
+        messages[preferred] = result
+
+    # Не подошёл - остальные методы проверяются одновременно
+    pending = {
+        loop.run_in_executor(None, _resolve_azure_ref_sync, auth_method, repo_url, base_api_url, ref_type.lower(), ref): auth_method
+        for auth_method in auth_methods if auth_method not in messages
+    }
+    while pending:
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            auth_method = pending.pop(future)
+            is_final, result = future.result()
+            if is_final:
+                # Остальные запросы дорабатывают в своих потоках, их результат не нужен
+                _preferred_auth_method = auth_method
+                return result
+            messages[auth_method] = result
+
+    # Ни один метод не подошёл - сообщение последнего по порядку метода, как при последовательном переборе
+    message = messages[auth_methods[-1]] if auth_methods else ""
     return False, None, message
 
 async def check_ref_and_resolve_git(repo_url: str, ref_type: str, ref: str):
@@ -393,12 +676,17 @@ async def check_ref_and_resolve_git(repo_url: str, ref_type: str, ref: str):
             return False, None, message
         
         else:
-            # For tags and branches, find matching reference and extract commit hash
-            ref_suffix = f"/{ref}"
+            # For tags and branches: один проход по выводу в словарь {имя ref: hash}, затем точный поиск
+            refs = {}
             for line in lines:
-                if line.endswith(ref_suffix):
-                    commit_hash = line.split()[0]
-                    return True, commit_hash, message
+                parts = line.split(None, 1)
+                if len(parts) == 2:
+                    refs[parts[1].strip()] = parts[0]
+            ref_name = f"refs/{'tags' if ref_type.lower() == 'tag' else 'heads'}/{ref}"
+            # Для аннотированного тега строка "^{}" содержит коммит, на который он указывает
+            commit_hash = refs.get(f"{ref_name}^{{}}") or refs.get(ref_name)
+            if commit_hash:
+                return True, commit_hash, message
             return False, None, message
 
     except Exception:
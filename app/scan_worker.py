@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import os
+from typing import Tuple
+from app.scanner import scan_repo_without_callback
+from app.model_loader import get_model_instance, filter_secrets_in_process
+
+# Код, выполняемый в model_executor (процессы, либо потоки при SCAN_EXECUTOR=thread). Все импорты на уровне модуля -
+# они выполняются один раз при старте процесса, а не на каждую задачу
+logger = logging.getLogger("scan_worker")
+
+# Модель и event loop, созданные один раз в каждом процессе пула (см. _worker_init)
+_MODEL = None
+_LOOP = None
+
+def _worker_init():
+    """Инициализатор процесса пула: загружаем модель и создаём event loop один раз на весь срок жизни процесса"""
+    global _MODEL, _LOOP
+    _MODEL = get_model_instance()
+    _LOOP = asyncio.new_event_loop()
+    asyncio.set_event_loop(_LOOP)
+
+def ping() -> int:
+    """Пустая задача для прогрева пула: к её выполнению процесс уже создан и модель загружена"""
+    return os.getpid()
+
+def _run_coroutine(coro):
+    """Выполнить корутину в постоянном loop процесса (без создания/закрытия loop на каждую задачу)"""
+    if _LOOP is None:
+        return asyncio.run(coro)
+    return _LOOP.run_until_complete(coro)
+
+def run_scan(repo_path: str, project_name: str) -> Tuple[list, int, int, str, dict, dict]:
+    """Process scanning and model inference in separate process.
+    В процесс передаются только путь и имя проекта - сканеру больше ничего из запроса не нужно"""
+    try:
+        # Perform scanning without model (in process)
+        results, files_excluded, file_count, skipped_files, detected_languages, detected_frameworks = _run_coroutine(scan_repo_without_callback(None, repo_path, project_name))
+
+        # Apply model filtering - модель уже загружена инициализатором процесса
+        if _MODEL is not None:
+            filtered_results = _MODEL.filter_secrets(project_name, results)
+        else:
+            filtered_results = filter_secrets_in_process(project_name, results)
+
+        return filtered_results, files_excluded, file_count, skipped_files, detected_languages, detected_frameworks
+
+    except Exception as e:
+        logger.error(f"Ошибка в процессе сканирования: {e}")
+        # Return empty results with error info
+        return [{"error": str(e), "path": "process_error", "severity": "High", "Type": "Process Error"}], 0, 0, "", {}, {}
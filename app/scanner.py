@@ -22,28 +22,42 @@ logging.basicConfig(
 )
 logger = logging.getLogger("scanner")
 
+# C-загрузчик libyaml, если PyYAML собран с ним (в разы быстрее чистого Python), иначе обычный SafeLoader
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 RULES_FILE = "Settings/rules.yml"
 
 def load_rules(rules_file="Settings/rules.yml"):
     try:
         with open(rules_file, "r", encoding="UTF-8") as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=YamlLoader)
     except Exception as error:
         logger.error(f"Error: {str(error)} Проверьте, существует ли файл ${rules_file}$ с набором правил.")
 
+def compile_rules(rules):
+    """Компилирует regex правил один раз на сканирование: [(pattern, message), ...].
+    Некорректное правило пропускается с ошибкой в логе, а не роняет анализ каждого файла"""
+    compiled = []
+    for rule in rules or []:
+        try:
+            compiled.append((re.compile(rule["pattern"]), rule.get("message", "Unknown")))
+        except (re.error, KeyError, TypeError) as error:
+            logger.error(f"Некорректное правило {rule}: {error}")
+    return compiled
+
 def load_other_rules():
     with open('Settings/excluded_files.yml', 'r') as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=YamlLoader)
 
     EXCLUDED_FILES = set(data.get('excluded_files', []))
 
     with open('Settings/excluded_extensions.yml', 'r') as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=YamlLoader)
 
     EXCLUDED_EXTENSIONS = set(data.get('excluded_extensions', []))
 
     with open('Settings/false-positive.yml', 'r') as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=YamlLoader)
 
     FALSE_POSITIVE_RULES = set(data.get('false_positive', []))
 
@@ -62,7 +76,7 @@ def load_frameworks_rules():
     """Загружает правила определения фреймворков"""
     try:
         with open('Settings/frameworks_detection.yml', 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=YamlLoader)
     except Exception as e:
         logger.error(f"Ошибка загрузки правил фреймворков: {e}")
         return {}
@@ -353,7 +367,7 @@ def is_extension_excluded(file_ext, EXCLUDED_EXTENSIONS):
     # return False
 
 async def _analyze_file(file_path, rules, target_dir, max_secrets=50, max_line_length=15_000, FALSE_POSITIVE_RULES=[]):
-    """Асинхронная функция для анализа файла с ограничениями"""
+    """Асинхронная функция для анализа файла с ограничениями (rules - результат compile_rules)"""
     results = []
     all_secrets = []
     secrets_found = 0
@@ -375,8 +389,8 @@ async def _analyze_file(file_path, rules, target_dir, max_secrets=50, max_line_l
                 })
                 continue
 
-            for rule in rules:
-                match = re.search(rule["pattern"], line)
+            for pattern, message in rules:
+                match = pattern.search(line)
                 if match:
                     secret = match.group(0)
                     context = line.strip()
@@ -388,7 +402,7 @@ async def _analyze_file(file_path, rules, target_dir, max_secrets=50, max_line_l
                             "context": context,
                             "severity": "",
                             "confidence": 1.0,
-                            "Type": rule.get("message", "Unknown")
+                            "Type": message
                         })
                         secrets_found += 1
 
@@ -447,13 +461,16 @@ async def scan_directory_without_callback(projectName, target_dir, rules, EXCLUD
     logger.info(f"[{projectName}] Найдено файлов для сканирования: {len(file_list)} (время сбора: {file_collection_time:.2f}с)")
     logger.info(f"[{projectName}] Пропущены файлы (by rules): {skipped_files}")
     
+    # Regex правил компилируются один раз, а не ищутся в кеше re на каждой строке
+    compiled_rules = compile_rules(rules)
+
     # Process files concurrently in batches
     batch_size = 5
     for i in range(0, len(file_list), batch_size):
         batch = file_list[i:i + batch_size]
         
         batch_tasks = [
-            search_secrets(file_path, rules, target_dir, max_secrets=50, max_line_length=15_000, FALSE_POSITIVE_RULES=FALSE_POSITIVE_RULES)
+            search_secrets(file_path, compiled_rules, target_dir, max_secrets=50, max_line_length=15_000, FALSE_POSITIVE_RULES=FALSE_POSITIVE_RULES)
             for file_path in batch
         ]
         
@@ -294,7 +294,8 @@ def print_startup_info():
     config = get_server_config()
     max_workers = os.getenv("MAX_WORKERS", "10")
     hub_type = os.getenv("HubType", "Azure")
-    temp_dir = os.getenv("TEMP_DIR", "C:\\")
+    # Та же папка, в которой queue_worker создаёт рабочие директории (по умолчанию /dev/shm, иначе системная временная)
+    from app.queue_worker import TEMP_DIR as temp_dir
     
     print("\n" + "=" * 60)
     print("SECRET SCANNER SERVICE")